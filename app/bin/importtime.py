@@ -0,0 +1,71 @@
+"""
+Замер времени импорта модулей запуска (python -X importtime) с проверкой бюджета.
+
+Использование (из каталога app):
+    python bin/importtime.py                          # модули по умолчанию
+    python bin/importtime.py src.scheduleDaemon       # выбранные модули
+    IMPORT_TIME_BUDGET_MS=200 python bin/importtime.py
+
+Каждый модуль импортируется в отдельном процессе. Выводится суммарное время
+импорта и самые долгие зависимости. Код возврата 1, если время импорта
+хотя бы одного модуля превышает бюджет.
+"""
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_MODULES = ('main', 'src.postgresExecutorAsync', 'src.postgresExecutorThreads', 'src.scheduleDaemon')
+BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '300'))
+TOP = int(os.getenv('IMPORT_TIME_TOP', '10'))
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """Суммарное время импорта модуля (мс) и список (время, модуль) для верхнего уровня зависимостей"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'ошибка импорта')
+
+    cumulative: Dict[str, float] = {}
+    top_level: List[Tuple[float, str]] = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, total, name = line[len('import time:'):].split('|', 2)
+        if not total.strip().isdigit():
+            continue
+        name = name[1:]
+        milliseconds = int(total) / 1000
+        cumulative[name.strip()] = milliseconds
+        # Вложенные импорты выводятся с отступом
+        if not name.startswith(' '):
+            top_level.append((milliseconds, name))
+    return cumulative.get(module, sum(ms for ms, _ in top_level)), sorted(top_level, reverse=True)
+
+
+def main(modules: List[str]) -> int:
+    failed = False
+    for module in modules:
+        try:
+            total, top_level = measure(module)
+        except RuntimeError as e:
+            print(f"{module}: {e}")
+            failed = True
+            continue
+        status = 'OK' if total <= BUDGET_MS else 'ПРЕВЫШЕН БЮДЖЕТ'
+        print(f"{module}: {total:.1f} мс (бюджет {BUDGET_MS:.0f} мс) {status}")
+        for milliseconds, name in top_level[:TOP]:
+            print(f"    {milliseconds:8.1f} мс  {name}")
+        failed = failed or total > BUDGET_MS
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:] or list(DEFAULT_MODULES)))
@@ -1,10 +1,17 @@
-from src.postgresExecutorThreads import PostgresRunThreads
-from src.postgresExecutorAsync import PostgresRunAsync
+from src.databaseSettings import settings
 
 if __name__ == "__main__":
 
+    # Импортируется только модуль выбранного исполнителя и его драйвер (asyncpg или psycopg2)
+
     # Запуск основной версии
+    # from src.postgresExecutorThreads import PostgresRunThreads
     # PostgresRunThreads.run()
 
-    PostgresRunAsync.run()
-    
\ No newline at end of file
+    if settings.RUN_MODE == 'daemon':
+        # Постоянная работа с запуском скриптов по расписанию (ключ schedule)
+        from src.scheduleDaemon import ScheduleDaemon
+        ScheduleDaemon.run()
+    else:
+        from src.postgresExecutorAsync import PostgresRunAsync
+        PostgresRunAsync.run()
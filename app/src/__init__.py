@@ -1,5 +1,26 @@
+import importlib
+
 from .logger import logger
-from .databaseSettings import settings
-from .parseScripts import scripts
-from .postgresExecutorThreads import PostgresExecutorThreads, PostgresRunThreads
-from .postgresExecutorAsync import PostgresExecutorAsync, PostgresRunAsync
\ No newline at end of file
+
+# Остальные имена пакета импортируются при первом обращении: импорт src не загружает
+# драйверы обоих исполнителей (psycopg2 и asyncpg), .env и scripts.yml
+_EXPORTS = {
+    'settings': 'databaseSettings',
+    'scripts': 'parseScripts',
+    'PostgresExecutorThreads': 'postgresExecutorThreads',
+    'PostgresRunThreads': 'postgresExecutorThreads',
+    'PostgresExecutorAsync': 'postgresExecutorAsync',
+    'PostgresRunAsync': 'postgresExecutorAsync',
+    'ScheduleDaemon': 'scheduleDaemon',
+}
+
+__all__ = ['logger', *_EXPORTS]
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
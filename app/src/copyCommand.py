@@ -0,0 +1,90 @@
+import glob
+from typing import Any, Dict, List, Optional
+
+# Поддерживаемые форматы COPY: ключ - значение из scripts.yml, значение - формат PostgreSQL
+COPY_FORMATS = {
+    'csv': 'csv',
+    'text': 'text',
+    'tsv': 'text',
+    'binary': 'binary',
+}
+
+
+def copy_format(fmt: Optional[str]) -> str:
+    """Нормализация формата COPY из scripts.yml (по умолчанию csv)"""
+    key = (fmt or 'csv').lower()
+    if key not in COPY_FORMATS:
+        raise ValueError(f"Неподдерживаемый формат COPY: {fmt}. Допустимые: {', '.join(COPY_FORMATS)}")
+    return COPY_FORMATS[key]
+
+
+def copy_options(query_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Параметры COPY из описания скрипта
+
+    Ключи scripts.yml: format, header, delimiter, null, encoding
+    """
+    fmt = copy_format(query_data.get('format'))
+    options: Dict[str, Any] = {'format': fmt}
+    if fmt == 'binary':
+        return options
+    if fmt == 'csv' and query_data.get('header') is not None:
+        options['header'] = bool(query_data.get('header'))
+    if query_data.get('delimiter') is not None:
+        options['delimiter'] = query_data['delimiter']
+    if query_data.get('null') is not None:
+        options['null'] = query_data['null']
+    if query_data.get('encoding') is not None:
+        options['encoding'] = query_data['encoding']
+    return options
+
+
+def copy_options_sql(options: Dict[str, Any]) -> str:
+    """Секция WITH (...) команды COPY для psycopg2 copy_expert"""
+    parts = []
+    for key, value in options.items():
+        if isinstance(value, bool):
+            parts.append(f"{key.upper()} {'true' if value else 'false'}")
+        elif key == 'format':
+            parts.append(f"FORMAT {value}")
+        else:
+            escaped = str(value).replace("'", "''")
+            parts.append(f"{key.upper()} '{escaped}'")
+    return f"WITH ({', '.join(parts)})"
+
+
+def copy_rows(status: Optional[str]) -> int:
+    """Количество строк из статуса команды COPY (формат: "COPY 123")"""
+    if not status:
+        return 0
+    parts = status.split()
+    return int(parts[-1]) if parts and parts[-1].isdigit() else 0
+
+
+def throughput_mb(size_bytes: int, seconds: float) -> float:
+    """Пропускная способность в МБ/сек"""
+    if seconds <= 0:
+        return 0.0
+    return size_bytes / (1024 * 1024) / seconds
+
+
+def load_files(pattern: str) -> List[str]:
+    """Список файлов для загрузки по пути или glob-шаблону"""
+    if not pattern:
+        raise ValueError("Не указан ключ 'file' для загрузки")
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"Не найдены файлы для загрузки: {pattern}")
+    return files
+
+
+def file_stats(file_path: str, rows: int, size_bytes: int, seconds: float) -> Dict[str, Any]:
+    """Статистика загрузки одного файла"""
+    return {
+        'file': file_path,
+        'rows': rows,
+        'bytes': size_bytes,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds > 0 else 0.0,
+        'mb_per_sec': throughput_mb(size_bytes, seconds),
+    }
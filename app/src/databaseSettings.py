@@ -1,5 +1,7 @@
 from pydantic_settings import BaseSettings
 
+from src.lazyObject import LazyObject
+
 class DatabaseSettings(BaseSettings):
     DATABASE_USER: str
     DATABASE_PASSWORD: str
@@ -12,8 +14,34 @@ class DatabaseSettings(BaseSettings):
     
     DATABASE_CONNECTION_TIMEOUT: int = 60
     DATABASE_COMMAND_TIMEOUT: int = 300
+    DATABASE_TIMEOUT_GRACE: float = 1
 
     ASYNC_CONCURRENT_MAX: int = 5
+    ASYNC_STREAM_CHUNK_SIZE: int = 1000
+    ASYNC_PROCESSES: int = 1
+
+    RUN_MODE: str = 'once'
+    SCRIPTS_RELOAD_INTERVAL: float = 5
+
+    THREADS_STREAM_ITERSIZE: int = 1000
+
+    COPY_CHUNK_SIZE: int = 1048576
+
+    PARAMS_BATCH_SIZE: int = 1000
+
+    RETRY_ATTEMPTS: int = 1
+    RETRY_BASE_DELAY: float = 0.5
+    RETRY_MAX_DELAY: float = 30
+    RETRY_SQLSTATES: str = ''
+
+    RESULT_ROW_FORMAT: str = 'dict'
+    RESULT_SPILL_THRESHOLD: int = 0
+    RESULT_SPILL_DIR: str = ''
+
+    METRICS_PORT: int = 0
+    METRICS_TEXTFILE: str = ''
+
+    TRACE_FILE: str = ''
 
     class Config:
         env_file = ".env"
@@ -34,4 +62,5 @@ class DatabaseSettings(BaseSettings):
             'password': self.DATABASE_PASSWORD
         }
     
-settings = DatabaseSettings()
\ No newline at end of file
+# Настройки читаются из окружения и .env при первом обращении
+settings = LazyObject(DatabaseSettings)
\ No newline at end of file
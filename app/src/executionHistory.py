@@ -0,0 +1,78 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+from src.logger import logger
+
+HISTORY_FILE_PATH = os.getenv('HISTORY_FILE_PATH', '/app/logs/history.json')
+
+
+class ExecutionHistory:
+    """
+    Хранилище длительности выполнения скриптов между запусками.
+
+    Для каждого скрипта хранится сглаженное (EWMA) время выполнения, по которому
+    планировщик запускает первыми самые долгие скрипты.
+    Пустой HISTORY_FILE_PATH отключает сохранение истории.
+    """
+
+    def __init__(self, file_path: str = HISTORY_FILE_PATH, smoothing: float = 0.5):
+        self.file_path = file_path
+        self.smoothing = smoothing
+        self.scripts: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Загрузка истории из файла (отсутствующий или поврежденный файл - пустая история)"""
+        self.scripts = {}
+        if not self.file_path or not os.path.exists(self.file_path):
+            return self.scripts
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.scripts = json.load(f).get('scripts', {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать историю выполнения {self.file_path}: {e}")
+        return self.scripts
+
+    def save(self) -> None:
+        """Атомарная запись истории в файл"""
+        if not self.file_path:
+            return
+        try:
+            directory = os.path.dirname(self.file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'scripts': self.scripts}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.file_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить историю выполнения {self.file_path}: {e}")
+
+    def estimate(self, name: str) -> Optional[float]:
+        """Ожидаемое время выполнения скрипта (секунды) или None, если истории нет"""
+        entry = self.scripts.get(name)
+        return entry['execution_time'] if entry else None
+
+    def record(self, name: str, execution_time: float) -> None:
+        """Учет времени успешного выполнения скрипта"""
+        entry = self.scripts.get(name)
+        if entry:
+            entry['execution_time'] = (
+                self.smoothing * execution_time + (1 - self.smoothing) * entry['execution_time']
+            )
+            entry['runs'] += 1
+        else:
+            entry = {'execution_time': execution_time, 'runs': 1}
+            self.scripts[name] = entry
+        entry['last'] = execution_time
+
+    def durations(self, scripts: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+        """
+        Ожидаемая длительность по ключам скриптов.
+        Для скриптов без истории используется среднее по известным.
+        """
+        known = {key: self.estimate((item or {}).get('name', key)) for key, item in scripts.items()}
+        values = [value for value in known.values() if value is not None]
+        default = sum(values) / len(values) if values else 0.0
+        return {key: default if value is None else value for key, value in known.items()}
@@ -0,0 +1,91 @@
+import ctypes
+import ctypes.util
+import os
+import sys
+from typing import Optional, Tuple
+
+from src.logger import logger
+
+# События inotify каталога: запись и закрытие файла, переименование, создание, удаление
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class FileWatcher:
+    """
+    Неблокирующее отслеживание изменений файла.
+
+    На Linux используется inotify для каталога файла (редакторы и ConfigMap
+    заменяют файл переименованием), дескриптор доступен через fileno() для
+    ожидания в цикле событий. Без inotify изменения определяются сравнением
+    inode, mtime и размера файла при каждом вызове changed().
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = os.path.abspath(file_path)
+        self._signature = self._stat()
+        self._fd = self._inotify()
+
+    @property
+    def inotify(self) -> bool:
+        return self._fd is not None
+
+    def fileno(self) -> Optional[int]:
+        return self._fd
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _inotify(self) -> Optional[int]:
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1')
+            directory = os.path.dirname(self.file_path) or '.'
+            if libc.inotify_add_watch(fd, os.fsencode(directory), IN_MASK) < 0:
+                errno = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(errno, f'inotify_add_watch {directory}')
+            return fd
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify недоступен ({e}), изменения {self.file_path} проверяются по mtime")
+            return None
+
+    def _drain(self) -> bool:
+        """Чтение накопившихся событий inotify без ожидания"""
+        received = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return received
+            if not data:
+                return received
+            received = True
+
+    def changed(self) -> bool:
+        """Изменился ли файл с предыдущей проверки (не блокирует)"""
+        if self._fd is not None and not self._drain():
+            return False
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,38 @@
+import threading
+from typing import Any, Callable
+
+
+class LazyObject:
+    """
+    Объект, создаваемый фабрикой при первом обращении к его атрибутам.
+
+    Позволяет импортировать settings и scripts без чтения .env и scripts.yml:
+    файлы читаются только тогда, когда значения действительно нужны.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get(self) -> Any:
+        instance = object.__getattribute__(self, '_instance')
+        if instance is None:
+            with object.__getattribute__(self, '_lock'):
+                instance = object.__getattribute__(self, '_instance')
+                if instance is None:
+                    instance = object.__getattribute__(self, '_factory')()
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._get(), name, value)
+
+    def __repr__(self) -> str:
+        instance = object.__getattribute__(self, '_instance')
+        if instance is None:
+            return f"<LazyObject {object.__getattribute__(self, '_factory').__name__} (не создан)>"
+        return repr(instance)
@@ -1,21 +1,94 @@
 
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+from datetime import datetime, timezone
+from typing import Any, Tuple
 
 LOG_FILE = os.getenv('LOG_FILE','/app/logs/sqlexecute.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))  # 0 - без ротации
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text или json
+
+class JsonFormatter(logging.Formatter):
+    """Структурированный лог: одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'process': record.processName,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+if LOG_FORMAT == 'json':
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# Запись в файл с ротацией по размеру. Файл открывается при первой записи: дочерние
+# процессы (см. use_process_queue) его не открывают и не ротируют
+file_handler = logging.handlers.RotatingFileHandler(
+    filename=LOG_FILE,
+    encoding='utf-8',
+    mode='a',
+    maxBytes=LOG_MAX_BYTES,
+    backupCount=LOG_BACKUP_COUNT,
+    delay=True)
+stream_handler = logging.StreamHandler()  # Дополнительно вывод в консоль (опционально)
+file_handler.setFormatter(formatter)
+stream_handler.setFormatter(formatter)
+
+# Запись в файл и консоль выполняется отдельным потоком QueueListener:
+# задачи asyncio и рабочие потоки только кладут запись в очередь и не ждут ввода-вывода
+log_queue = queue.SimpleQueue()
+listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+queue_handler = logging.handlers.QueueHandler(log_queue)
+# Итоговое форматирование выполняют обработчики QueueListener
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
 
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
-    
-    handlers=[
-        logging.FileHandler(
-            filename=LOG_FILE,
-            encoding='utf-8',
-            mode='a'),  # Запись в файл
-        logging.StreamHandler()  # Дополнительно вывод в консоль (опционально)
-    ]
+    handlers=[queue_handler]
 )
 
-logger = logging.getLogger(__name__)
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+
+def start_process_listener(context) -> Tuple[Any, logging.handlers.QueueListener]:
+    """
+    Очередь для записей дочерних процессов (context - контекст multiprocessing) и поток,
+    который пишет их обработчиками этого процесса. Ротацию файла выполняет только родитель
+    """
+    process_queue = context.Queue()
+    process_listener = logging.handlers.QueueListener(
+        process_queue, file_handler, stream_handler, respect_handler_level=True)
+    process_listener.start()
+    return process_queue, process_listener
+
+
+def use_process_queue(process_queue) -> None:
+    """
+    Настройка логирования дочернего процесса (initializer пула процессов):
+    записи передаются родителю через process_queue, собственные обработчики не используются
+    """
+    atexit.unregister(listener.stop)
+    listener.stop()
+    file_handler.close()
+    handler = logging.handlers.QueueHandler(process_queue)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    root = logging.getLogger()
+    root.removeHandler(queue_handler)
+    root.addHandler(handler)
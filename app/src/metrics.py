@@ -0,0 +1,239 @@
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.logger import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Базовая метрика с метками"""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться при каждом экспорте (set_function)"""
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        for key, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (сумма, количество, накопительные корзины)"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in values:
+            for i, bound in enumerate(self.buckets):
+                labels = _labels(self.labelnames, key, ('le', _number(bound)))
+                yield f"{self.name}_bucket{labels} {int(state[i])}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {int(state[-1])}"
+
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+QUERY_DURATION = Histogram(
+    'sqlexecute_query_duration_seconds', 'Длительность выполнения скрипта', ['script', 'status'])
+QUERY_ROWS = Counter(
+    'sqlexecute_query_rows_total', 'Количество полученных или обработанных строк', ['script'])
+QUERY_RETRIES = Counter(
+    'sqlexecute_query_retries_total', 'Количество повторов скриптов после временных ошибок', ['script', 'sqlstate'])
+POOL_ACQUIRE_WAIT = Histogram(
+    'sqlexecute_pool_acquire_wait_seconds', 'Ожидание соединения из пула', ['executor'])
+QUERIES_IN_FLIGHT = Gauge(
+    'sqlexecute_queries_in_flight', 'Количество выполняющихся скриптов', ['executor'])
+POOL_SIZE = Gauge(
+    'sqlexecute_pool_size', 'Количество открытых соединений в пуле', ['executor'])
+POOL_IDLE = Gauge(
+    'sqlexecute_pool_idle', 'Количество свободных соединений в пуле', ['executor'])
+
+
+def observe_script(script: str, success: bool, skipped: bool, execution_time: float, rows: int) -> None:
+    """Учет результата выполнения скрипта"""
+    status = 'success' if success else ('skipped' if skipped else 'error')
+    QUERY_DURATION.observe(execution_time, script=script, status=status)
+    if rows:
+        QUERY_ROWS.inc(rows, script=script)
+
+
+def _metrics_handler():
+    # http.server импортируется только при включенном METRICS_PORT
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _MetricsHandler
+
+
+_server = None
+
+
+def start_http_server(port: int, address: str = '0.0.0.0') -> None:
+    """Запуск HTTP-экспорта метрик (/metrics) в фоновом потоке"""
+    global _server
+    if _server is not None or not port:
+        return
+    from http.server import ThreadingHTTPServer
+    try:
+        _server = ThreadingHTTPServer((address, port), _metrics_handler())
+    except OSError as e:
+        logger.error(f"Не удалось запустить экспорт метрик на порту {port}: {e}")
+        return
+    threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Экспорт метрик Prometheus: http://{address}:{port}/metrics")
+
+
+def write_textfile(file_path: str) -> None:
+    """Атомарная запись метрик в файл для textfile collector node_exporter"""
+    if not file_path:
+        return
+    try:
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(REGISTRY.render())
+        os.replace(tmp_path, file_path)
+    except OSError as e:
+        logger.error(f"Не удалось записать метрики в {file_path}: {e}")
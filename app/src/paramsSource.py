@@ -0,0 +1,76 @@
+import csv
+import json
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+def _parse_scalar(value: str) -> Any:
+    """Преобразование значения из CSV: пустая строка - NULL, числа и true/false - в типы Python"""
+    if value == '':
+        return None
+    lowered = value.lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _read_csv(file_path: str, header: bool, delimiter: str) -> Iterator[Sequence[Any]]:
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        if header:
+            next(reader, None)
+        for row in reader:
+            yield tuple(_parse_scalar(value) for value in row)
+
+
+def _read_jsonl(file_path: str, columns: Optional[List[str]]) -> Iterator[Sequence[Any]]:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                yield tuple(item.get(column) for column in columns) if columns else tuple(item.values())
+            elif isinstance(item, list):
+                yield tuple(item)
+            else:
+                yield (item,)
+
+
+def iter_params(query_data: Dict[str, Any]) -> Iterator[Sequence[Any]]:
+    """
+    Наборы параметров из ключа params_batch скрипта.
+
+    params_batch - список наборов параметров или путь к файлу:
+        *.csv   - строка файла - набор параметров (params_header, params_delimiter);
+                  пустые значения - NULL, числа и true/false преобразуются в типы Python
+        *.jsonl - строка файла - JSON-массив или объект (порядок полей - params_columns)
+    Файлы читаются построчно и целиком в память не загружаются.
+    """
+    source = query_data.get('params_batch')
+    if source is None:
+        return iter(())
+    if not isinstance(source, str):
+        return (tuple(params) if isinstance(params, (list, tuple)) else (params,) for params in source)
+    if source.lower().endswith('.jsonl') or source.lower().endswith('.ndjson'):
+        return _read_jsonl(source, query_data.get('params_columns'))
+    if source.lower().endswith('.csv') or source.lower().endswith('.tsv'):
+        delimiter = query_data.get('params_delimiter') or ('\t' if source.lower().endswith('.tsv') else ',')
+        return _read_csv(source, bool(query_data.get('params_header')), delimiter)
+    raise ValueError(f"Неподдерживаемый файл параметров: {source}. Допустимые: .csv, .tsv, .jsonl")
+
+
+def batched(items: Iterable[Sequence[Any]], size: int) -> Iterator[List[Sequence[Any]]]:
+    """Разбиение наборов параметров на порции по size штук"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
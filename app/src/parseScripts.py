@@ -1,32 +1,184 @@
-import yaml
-from typing import Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
+from dataclasses import dataclass, field
 from datetime import datetime
+import hashlib
 import os
+import pickle
+
+from src.lazyObject import LazyObject
+from src.logger import logger
+from src.sqlClassifier import SqlInfo, classify_sql, prime
 
 SCRIPTS_FILE_PATH = os.getenv('SCRIPT_FILE_PATH','./config/scripts.yml')
+# Скомпилированный каталог скриптов (пустое значение отключает кэш)
+SCRIPTS_CACHE_PATH = os.getenv('SCRIPTS_CACHE_PATH', '/app/logs/scripts.catalog')
+
+# Версия формата каталога: при изменении формата старые файлы перестраиваются
+CATALOG_VERSION = 3
+
+
+@dataclass
+class ScriptsDiff:
+    """Разница между двумя версиями scripts.yml"""
+    added: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    removed: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    changed: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self) -> str:
+        return f"добавлено {len(self.added)}, удалено {len(self.removed)}, изменено {len(self.changed)}"
+
+
+def diff_scripts(old: Dict[str, Dict[str, Any]], new: Dict[str, Dict[str, Any]]) -> ScriptsDiff:
+    """Сравнение скриптов по ключам; changed содержит новые параметры измененных скриптов"""
+    return ScriptsDiff(
+        added={key: item for key, item in new.items() if key not in old},
+        removed={key: item for key, item in old.items() if key not in new},
+        changed={key: item for key, item in new.items() if key in old and old[key] != item}
+    )
+
 
 class ParseScripts:
     scripts :dict
     file_path :str = SCRIPTS_FILE_PATH
+    cache_path :str = SCRIPTS_CACHE_PATH
 
-    def __init__(self, file_path :str = SCRIPTS_FILE_PATH):
+    def __init__(self, file_path :str = SCRIPTS_FILE_PATH, cache_path :str = SCRIPTS_CACHE_PATH):
 
         self.scripts = {}
+        self.classes: Dict[str, SqlInfo] = {}
         self.file_path = file_path
+        self.cache_path = cache_path
         self.loadFromYml()
 
     def loadFromYml(self) -> Dict[str, Dict[str, str]]:
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
-        
-        self.scripts = {}
-        
-        if 'scripts' not in data:
-            raise ValueError("YAML файл должен содержать ключ 'scripts'")
-        
-        self.scripts = data.get('scripts', {})
-        
+        """
+        Загрузка скриптов. Если каталог (cache_path) построен по этому же файлу
+        (путь, mtime и размер или sha256 содержимого совпадают), YAML не разбирается.
+        Иначе файл разбирается, проверяется и каталог перестраивается.
+        Классификация SQL скриптов хранится в каталоге и заполняет кэш classify_sql.
+        """
+        stat = os.stat(self.file_path)
+        catalog = self.loadCatalog()
+        if catalog is not None and self._sameStat(catalog, stat):
+            self.scripts = catalog['scripts']
+            self.classes = catalog['classes']
+            prime(self.classes)
+            return self.scripts
+
+        with open(self.file_path, 'rb') as f:
+            source = f.read()
+        digest = hashlib.sha256(source).hexdigest()
+
+        if catalog is not None and catalog.get('sha256') == digest:
+            # Файл сохранен без изменений содержимого: обновляем только ключ каталога
+            self.scripts = catalog['scripts']
+            self.classes = catalog['classes']
+            prime(self.classes)
+        else:
+            self.scripts = self.parse(source)
+            self.classes = self.classify(self.scripts)
+        self.saveCatalog(self.scripts, stat, digest)
+
         return self.scripts
-    
-    
-scripts = ParseScripts()
\ No newline at end of file
+
+    def reload(self) -> ScriptsDiff:
+        """
+        Повторная загрузка файла и разница с текущими скриптами.
+        При ошибке чтения или разбора исключение пробрасывается, текущие скрипты сохраняются.
+        """
+        previous = self.scripts
+        try:
+            current = self.loadFromYml()
+        except Exception:
+            self.scripts = previous
+            raise
+        return diff_scripts(previous, current)
+
+    def watch(self):
+        """Отслеживание изменений файла (inotify или проверка mtime), см. FileWatcher"""
+        from src.fileWatcher import FileWatcher
+        return FileWatcher(self.file_path)
+
+    @staticmethod
+    def parse(source: Union[bytes, str]) -> Dict[str, Dict[str, Any]]:
+        """Разбор и проверка содержимого scripts.yml"""
+        # PyYAML нужен только при изменении файла
+        import yaml
+        from src.scriptScheduler import ScriptGraph
+
+        data = yaml.safe_load(source)
+
+        if not isinstance(data, dict) or 'scripts' not in data:
+            raise ValueError("YAML файл должен содержать ключ 'scripts'")
+
+        scripts = data.get('scripts') or {}
+        if not isinstance(scripts, dict):
+            raise ValueError("Ключ 'scripts' должен содержать словарь скриптов")
+        for key, item in scripts.items():
+            if not isinstance(item, dict):
+                raise ValueError(f"Скрипт '{key}' должен быть словарем параметров")
+
+        # Проверка depends_on: неизвестные скрипты и циклы
+        ScriptGraph(scripts)
+
+        return scripts
+
+    @staticmethod
+    def classify(scripts: Dict[str, Dict[str, Any]]) -> Dict[str, SqlInfo]:
+        """Классификация SQL всех скриптов (текст скрипта -> SqlInfo)"""
+        return {
+            item['sql']: classify_sql(item['sql'])
+            for item in scripts.values()
+            if isinstance(item.get('sql'), str)
+        }
+
+    def _sameStat(self, catalog: Dict[str, Any], stat: os.stat_result) -> bool:
+        return (catalog.get('mtime_ns') == stat.st_mtime_ns
+                and catalog.get('size') == stat.st_size)
+
+    def loadCatalog(self) -> Optional[Dict[str, Any]]:
+        """Чтение каталога; отсутствующий, устаревший или поврежденный каталог - None"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                catalog = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать каталог скриптов {self.cache_path}: {e}")
+            return None
+        if (not isinstance(catalog, dict)
+                or catalog.get('version') != CATALOG_VERSION
+                or catalog.get('path') != os.path.abspath(self.file_path)):
+            return None
+        return catalog
+
+    def saveCatalog(self, scripts: Dict[str, Dict[str, Any]], stat: os.stat_result, digest: str) -> None:
+        """Атомарная запись каталога"""
+        if not self.cache_path:
+            return
+        catalog = {
+            'version': CATALOG_VERSION,
+            'path': os.path.abspath(self.file_path),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': digest,
+            'scripts': scripts,
+            'classes': self.classes,
+        }
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Не удалось записать каталог скриптов {self.cache_path}: {e}")
+
+
+# scripts.yml читается при первом обращении
+scripts = LazyObject(ParseScripts)
@@ -0,0 +1,39 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from src.spanTracer import TRACER
+
+# Фазы выполнения запроса:
+#   acquire_wait   - ожидание соединения из пула
+#   server_exec    - выполнение на сервере (для fetch/fetchall включает и передачу результата)
+#   fetch_transfer - получение порций строк серверного курсора
+#   decode         - преобразование строк в объекты Python (dict, columnar, сброс на диск)
+#   sink_write     - передача порций строк обработчику / запись в файл
+#   commit         - фиксация транзакции
+PHASES = ('acquire_wait', 'server_exec', 'fetch_transfer', 'decode', 'sink_write', 'commit')
+
+
+class PhaseTimer:
+    """Накопление длительности фаз выполнения запроса (секунды); каждый замер - интервал трассировки"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        TRACER.record(name, seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Замер фазы; внутри блока допускается await"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @staticmethod
+    def format(phases: Dict[str, float]) -> str:
+        """Строка для лога: acquire_wait=0.001 server_exec=0.120 ..."""
+        return ' '.join(f"{name}={phases[name]:.3f}" for name in PHASES if name in phases)
@@ -1,13 +1,27 @@
 from datetime import datetime
 import json
-from typing import List, Optional, Dict, Any, AsyncGenerator
+import os
+from typing import List, Optional, Dict, Any, AsyncGenerator, AsyncIterator, Callable, Iterable, Sequence, Tuple
 from contextlib import asynccontextmanager
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 from src.databaseSettings import settings
 import asyncio
+import inspect
 import asyncpg
-from src.logger import logger
+from src.logger import logger, start_process_listener, use_process_queue
 from src.parseScripts import scripts
+from src.copyCommand import copy_options, copy_rows, throughput_mb, load_files, file_stats
+from src.scriptScheduler import ScriptGraph
+from src.executionHistory import ExecutionHistory
+from src.paramsSource import iter_params, batched
+from src.resultSinks import create_sink
+from src.rowFormats import ColumnarResult, row_format as check_row_format, convert_rows, portable_data
+from src.spillStorage import SpillBuffer, SpilledRows
+from src import metrics
+from src.phaseTimer import PhaseTimer
+from src.spanTracer import TRACER
+from src.sqlClassifier import classify_sql, split_statements, group_statements, split_mode
+from src.retryPolicy import RetryPolicy, default_policy, next_delay, error_sqlstate
 
 @dataclass
 class QueryResult:
@@ -17,13 +31,31 @@ class QueryResult:
     execution_time: float
     rows_affected: int = 0
     error: Optional[str] = None
-    data: Optional[List[Dict[str, Any]]] = None
+    data: Optional[Any] = None  # Строки в формате row_format: list[dict], list[tuple], list[Record], ColumnarResult или SpilledRows
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    bytes_written: int = 0
+    throughput: float = 0.0  # МБ/сек для COPY-заданий
+    files: Optional[List[Dict[str, Any]]] = None  # Статистика по файлам для type: load и sink
+    skipped: bool = False  # Не запускался из-за ошибки в зависимостях (depends_on)
+    chunks: Optional[List[Dict[str, Any]]] = None  # Статистика по порциям для params_batch
+    columns: Optional[List[str]] = None  # Имена колонок для row_format tuple, record и columnar
+    phases: Optional[Dict[str, float]] = None  # Длительность фаз: acquire_wait, server_exec, fetch_transfer, decode, commit
+    statements: Optional[List[Dict[str, Any]]] = None  # Статистика по выражениям для split
+    sqlstate: Optional[str] = None  # Код ошибки PostgreSQL (SQLSTATE)
+    attempts: int = 1  # Количество попыток выполнения (с учетом повторов по retry)
     
     def to_dict(self) -> Dict[str, Any]:
         """Конвертация в словарь"""
-        result = asdict(self)
+        result = {field.name: getattr(self, field.name) for field in fields(self)}
+        if isinstance(self.data, ColumnarResult):
+            result['data'] = self.data.to_dict()
+        elif isinstance(self.data, SpilledRows):
+            result['data'] = {'spilled': self.data.path, 'rows': len(self.data)}
+        elif isinstance(self.data, list):
+            result['data'] = [row if isinstance(row, dict) else tuple(row) for row in self.data]
+        if self.phases is not None:
+            result['phases'] = dict(self.phases)
         if self.started_at:
             result['started_at'] = self.started_at.isoformat()
         if self.completed_at:
@@ -39,19 +71,26 @@ class PostgresExecutorAsync:
     
     def __init__(
         self,
-        host: str = settings.DATABASE_HOST, 
-        port: int = settings.DATABASE_PORT, 
-        database: str = settings.DATABASE_DB, 
-        user: str = settings.DATABASE_USER, 
-        password: str = settings.DATABASE_PASSWORD,
-        min_connections: int = settings.DATABASE_CONNECTIONS_MIN,
-        max_connections: int = settings.DATABASE_CONNECTIONS_MAX,
-        connection_timeout: int = settings.DATABASE_CONNECTION_TIMEOUT,
-        command_timeout: int = settings.DATABASE_COMMAND_TIMEOUT,
-        concurrent_max: int = settings.ASYNC_CONCURRENT_MAX
+        host: Optional[str] = None, 
+        port: Optional[int] = None, 
+        database: Optional[str] = None, 
+        user: Optional[str] = None, 
+        password: Optional[str] = None,
+        min_connections: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        connection_timeout: Optional[int] = None,
+        command_timeout: Optional[int] = None,
+        concurrent_max: Optional[int] = None,
+        stream_chunk_size: Optional[int] = None,
+        copy_chunk_size: Optional[int] = None,
+        params_batch_size: Optional[int] = None,
+        row_format: Optional[str] = None,
+        spill_threshold: Optional[int] = None,
+        spill_dir: Optional[str] = None
     ):
         """
-        Инициализация асинхронного исполнителя
+        Инициализация асинхронного исполнителя.
+        Незаданные параметры берутся из настроек (settings) при создании исполнителя
         
         Args:
             host: Хост БД
@@ -64,6 +103,12 @@ class PostgresExecutorAsync:
             connection_timeout: Таймаут подключения (секунды)
             command_timeout: Таймаут выполнения команд (секунды)
             concurrent_max: Мкасимальное количество одновременных запусков
+            stream_chunk_size: Размер порции строк для режима fetch: stream
+            copy_chunk_size: Размер блока чтения файла для type: load (байты)
+            params_batch_size: Размер порции наборов параметров для params_batch
+            row_format: Формат строк результата по умолчанию: dict, tuple, record, columnar
+            spill_threshold: Порог размера результата (байты), после которого строки сбрасываются на диск (0 - выключено)
+            spill_dir: Каталог для временных файлов сброса (по умолчанию системный)
         """
         self.dsn = settings.DATABASE_URL
         self.db_params = settings.DATABASE_PARAMS
@@ -72,7 +117,14 @@ class PostgresExecutorAsync:
         self.max_connections = max_connections or settings.DATABASE_CONNECTIONS_MAX
         self.connection_timeout = connection_timeout or settings.DATABASE_CONNECTION_TIMEOUT
         self.command_timeout = command_timeout or settings.DATABASE_COMMAND_TIMEOUT
+        self.timeout_grace = settings.DATABASE_TIMEOUT_GRACE
         self.concurrent_max = concurrent_max or settings.ASYNC_CONCURRENT_MAX
+        self.stream_chunk_size = stream_chunk_size or settings.ASYNC_STREAM_CHUNK_SIZE
+        self.copy_chunk_size = copy_chunk_size or settings.COPY_CHUNK_SIZE
+        self.params_batch_size = params_batch_size or settings.PARAMS_BATCH_SIZE
+        self.row_format = check_row_format(row_format, settings.RESULT_ROW_FORMAT)
+        self.spill_threshold = settings.RESULT_SPILL_THRESHOLD if spill_threshold is None else spill_threshold
+        self.spill_dir = spill_dir or settings.RESULT_SPILL_DIR
 
         self.connection_pool: Optional[asyncpg.pool.Pool] = None
         
@@ -89,6 +141,9 @@ class PostgresExecutorAsync:
                 init=self._init_connection,
             )
             logger.info("Асинхронный пул соединений с PostgreSQL создан успешно")
+            pool = self.connection_pool
+            metrics.POOL_SIZE.set_function(pool.get_size, executor='async')
+            metrics.POOL_IDLE.set_function(pool.get_idle_size, executor='async')
         except Exception as e:
             logger.error(f"Ошибка создания пула соединений: {e}")
             raise
@@ -103,6 +158,56 @@ class PostgresExecutorAsync:
         )
         await connection.execute("SET TIME ZONE 'UTC'")
 
+    @asynccontextmanager
+    async def _acquire(
+        self,
+        timer: Optional[PhaseTimer] = None,
+        timeout: Optional[float] = None
+    ) -> AsyncGenerator[asyncpg.Connection, None]:
+        """
+        Получение соединения из пула с учетом времени ожидания в метриках и фазе acquire_wait.
+        timeout задает statement_timeout соединения: запрос отменяет сам сервер, соединение остается рабочим.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async with self.connection_pool.acquire() as connection:
+            wait = loop.time() - start
+            metrics.POOL_ACQUIRE_WAIT.observe(wait, executor='async')
+            if timer:
+                timer.add('acquire_wait', wait)
+            if timeout:
+                await connection.execute(f"SET statement_timeout = {int(timeout * 1000)}")
+            yield connection
+            # При ошибке или отмене пул сбрасывает настройки соединения сам (RESET ALL при возврате)
+            if timeout:
+                await connection.execute("RESET statement_timeout")
+
+    def _deadline(self, timeout: Optional[float]) -> Optional[float]:
+        """
+        Клиентский таймаут обращения asyncpg: по истечении asyncpg отменяет запрос на сервере.
+        Больше statement_timeout на DATABASE_TIMEOUT_GRACE, чтобы первым срабатывал серверный таймаут
+        """
+        return timeout + self.timeout_grace if timeout else None
+
+    @staticmethod
+    async def _result_columns(
+        connection: asyncpg.Connection,
+        sql: str,
+        rows: Sequence[asyncpg.Record],
+        fmt: str,
+        timeout: Optional[float] = None
+    ) -> Optional[List[str]]:
+        """
+        Имена колонок результата для форматов tuple, record и columnar (для dict - None).
+        Берутся из первой строки; для пустого результата - из описания подготовленного выражения
+        """
+        if fmt == 'dict':
+            return None
+        if rows:
+            return list(rows[0].keys())
+        statement = await connection.prepare(sql, timeout=timeout)
+        return [attribute.name for attribute in statement.get_attributes()]
+
     @asynccontextmanager
     async def get_connection(self) -> AsyncGenerator[asyncpg.Connection, None]:
         """
@@ -115,7 +220,7 @@ class PostgresExecutorAsync:
         if not self.connection_pool:
             raise RuntimeError("Пул соединений не инициализирован. Вызовите initialize()")
         
-        async with self.connection_pool.acquire() as connection:
+        async with self._acquire() as connection:
             try:
                 yield connection
             except Exception as e:
@@ -129,7 +234,12 @@ class PostgresExecutorAsync:
         sql: str,
         query_name: str = "Unnamed Query",
         params: Optional[List[Any]] = None,
-        timeout: Optional[int] = None
+        timeout: Optional[int] = None,
+        fetch: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        consumer: Optional[Callable[[List[asyncpg.Record]], Any]] = None,
+        row_format: Optional[str] = None,
+        spill_threshold: Optional[int] = None
     ) -> QueryResult:
         """
         Выполнение одного SQL запроса
@@ -139,15 +249,22 @@ class PostgresExecutorAsync:
             query_name: Имя запроса для логирования
             params: Параметры запроса
             timeout: Таймаут выполнения (секунды)
+            fetch: Режим получения данных: None - все строки в память, 'stream' - порциями через курсор
+            chunk_size: Размер порции строк для режима 'stream'
+            consumer: Обработчик порции строк (обычная или async функция) для режима 'stream'
+            row_format: Формат строк в result.data (по умолчанию формат исполнителя)
+            spill_threshold: Порог сброса результата на диск (байты), по умолчанию порог исполнителя
             
         Returns:
             QueryResult с результатами выполнения
         """
+        timer = PhaseTimer()
         result = QueryResult(
             query_name=query_name,
             success=False,
             execution_time=0,
-            started_at=datetime.utcnow()
+            started_at=datetime.utcnow(),
+            phases=timer.phases
         )
         
         start_time = asyncio.get_event_loop().time()
@@ -156,43 +273,80 @@ class PostgresExecutorAsync:
             if not self.connection_pool:
                 raise RuntimeError("Пул соединений не инициализирован.")
 
-            async with self.connection_pool.acquire() as connection:
+            async with self._acquire(timer, timeout) as connection:
                 logger.info(f"[{query_name}] Начало выполнения SQL")
                 
-                # Определяем тип запроса
-                is_select = sql.strip().upper().startswith('SELECT')
-                is_with = sql.strip().upper().startswith('WITH')
+                # Тип запроса определяется лексическим разбором (с кэшированием по тексту)
+                info = classify_sql(sql)
                 
-                if is_select or (is_with and 'SELECT' in sql.strip().upper()):
+                # Курсор asyncpg (портал протокола) читает порциями результат любого
+                # выражения, возвращающего строки, в том числе INSERT ... RETURNING
+                if info.returns_rows and fetch == 'stream':
+                    # Потоковое чтение: в памяти не больше одной порции строк
+                    result.rows_affected = await self._stream_query(
+                        connection, sql, params, chunk_size or self.stream_chunk_size, consumer, timer,
+                        timeout=self._deadline(timeout)
+                    )
+                    logger.info(f"[{query_name}] Получено {result.rows_affected} строк (stream)")
+                elif info.returns_rows:
                     # Для запросов, возвращающих данные
-                    if params:
-                        rows = await connection.fetch(sql, *params)
+                    fmt = check_row_format(row_format, self.row_format)
+                    threshold = self.spill_threshold if spill_threshold is None else spill_threshold
+                    if threshold:
+                        # Чтение порциями со сбросом на диск после превышения порога
+                        buffer = SpillBuffer(threshold, fmt, self.spill_dir)
+                        loop = asyncio.get_running_loop()
+                        
+                        async def collect(rows: List[asyncpg.Record]) -> None:
+                            await loop.run_in_executor(None, buffer.extend, rows)
+                        
+                        try:
+                            await self._stream_query(
+                                connection, sql, params, chunk_size or self.stream_chunk_size, collect,
+                                timer, consumer_phase='decode', timeout=self._deadline(timeout)
+                            )
+                        except BaseException:
+                            buffer.discard()
+                            raise
+                        if fmt != 'dict' and buffer.columns is None:
+                            buffer.columns = await self._result_columns(
+                                connection, sql, [], fmt, timeout=self._deadline(timeout))
+                        with timer.phase('decode'):
+                            result.data = buffer.result()
+                        result.columns = buffer.columns if fmt != 'dict' else None
+                        result.rows_affected = buffer.length
+                        if buffer.spilled:
+                            logger.info(f"[{query_name}] Результат (~{buffer.estimated_bytes} байт) сброшен на диск")
                     else:
-                        rows = await connection.fetch(sql)
-                    
-                    result.data = [dict(row) for row in rows]
-                    result.rows_affected = len(result.data)
+                        # fetch возвращает результат целиком: выполнение и передача не разделяются
+                        with timer.phase('server_exec'):
+                            rows = await connection.fetch(sql, *(params or []), timeout=self._deadline(timeout))
+                        
+                        result.columns = await self._result_columns(
+                            connection, sql, rows, fmt, timeout=self._deadline(timeout))
+                        with timer.phase('decode'):
+                            result.data = convert_rows(rows, fmt, result.columns)
+                        result.rows_affected = len(rows)
                     logger.info(f"[{query_name}] Получено {result.rows_affected} строк")
                 else:
-                    async with connection.transaction():
-                        if params:
-                            status = await connection.execute(sql, *params)
-                        else:
-                            status = await connection.execute(sql)
-                        if status:
-                            # Формат: "INSERT 0 1", "UPDATE 5", "DELETE 3"
-                            parts = status.split()
-                            if len(parts) >= 2:
-                                try:
-                                    # Для INSERT формат: "INSERT 0 1" - последнее число это количество
-                                    if parts[0].upper() == 'INSERT':
-                                        result.rows_affected = int(parts[-1]) if parts[-1].isdigit() else 0
-                                    # Для UPDATE/DELETE формат: "UPDATE 5" или "DELETE 3"
-                                    else:
-                                        result.rows_affected = int(parts[-1]) if parts[-1].isdigit() else 0
-                                except (ValueError, IndexError):
-                                    result.rows_affected = 0
-                        logger.info(f"[{query_name}] Обработано {result.rows_affected} строк")
+                    if info.transactional:
+                        transaction = connection.transaction()
+                        await transaction.start()
+                        try:
+                            with timer.phase('server_exec'):
+                                status = await connection.execute(sql, *(params or []),
+                                                                  timeout=self._deadline(timeout))
+                        except BaseException:
+                            await transaction.rollback()
+                            raise
+                        with timer.phase('commit'):
+                            await transaction.commit()
+                    else:
+                        # VACUUM, CALL, CREATE INDEX CONCURRENTLY и т.п. нельзя выполнять в явной транзакции
+                        with timer.phase('server_exec'):
+                            status = await connection.execute(sql, *(params or []), timeout=self._deadline(timeout))
+                    result.rows_affected = self._status_rows(status)
+                    logger.info(f"[{query_name}] Обработано {result.rows_affected} строк")
 
                 result.success = True
 
@@ -203,6 +357,7 @@ class PostgresExecutorAsync:
         except Exception as e:
             logger.error(f"[{query_name}] Ошибка при выполнении SQL: {e}")
             result.error = str(e)
+            result.sqlstate = error_sqlstate(e)
         finally:
             result.execution_time = asyncio.get_event_loop().time() - start_time
             result.completed_at = datetime.utcnow()
@@ -210,17 +365,584 @@ class PostgresExecutorAsync:
         
         return result
     
+    @staticmethod
+    def _status_rows(status: Optional[str]) -> int:
+        """Количество строк из статуса команды (INSERT 0 1, UPDATE 5, DELETE 3)"""
+        parts = status.split() if status else []
+        return int(parts[-1]) if len(parts) >= 2 and parts[-1].isdigit() else 0
+
+    async def execute_statements(
+        self,
+        sql: str,
+        query_name: str = "Unnamed Script",
+        params: Optional[List[Any]] = None,
+        timeout: Optional[int] = None,
+        pipeline: bool = False,
+        row_format: Optional[str] = None
+    ) -> QueryResult:
+        """
+        Выполнение скрипта из нескольких выражений по отдельности (ключ split):
+        в одной транзакции на одном соединении со статистикой по каждому выражению.
+        Параметры $n скрипта передаются тем выражениям, которые на них ссылаются.
+        
+        Args:
+            sql: SQL скрипт, выражения разделены ;
+            query_name: Имя запроса для логирования
+            params: Параметры скрипта
+            timeout: Таймаут выполнения одного выражения (секунды)
+            pipeline: Подряд идущие выражения без параметров, не возвращающие строк,
+                      отправляются одним простым запросом (одно обращение к серверу на группу)
+            row_format: Формат строк в result.data (по умолчанию формат исполнителя)
+            
+        Returns:
+            QueryResult, где data - строки последнего выражения, возвращающего строки,
+            rows_affected - сумма по выражениям, statements - статистика по выражениям (группам)
+        """
+        timer = PhaseTimer()
+        result = QueryResult(
+            query_name=query_name,
+            success=False,
+            execution_time=0,
+            started_at=datetime.utcnow(),
+            statements=[],
+            phases=timer.phases
+        )
+        
+        loop = asyncio.get_event_loop()
+        start_time = loop.time()
+        number = 1
+        
+        try:
+            if not self.connection_pool:
+                raise RuntimeError("Пул соединений не инициализирован.")
+
+            fmt = check_row_format(row_format, self.row_format)
+            statements = split_statements(sql)
+            blocked = [statement.info.command for statement in statements if not statement.info.transactional]
+            if blocked:
+                raise ValueError(f"Выражения {', '.join(blocked)} нельзя выполнять в транзакции (split)")
+            if pipeline:
+                groups = group_statements(statements, lambda statement: not statement.info.returns_rows
+                                          and not statement.params)
+            else:
+                groups = [[statement] for statement in statements]
+
+            async with self._acquire(timer, timeout) as connection:
+                logger.info(f"[{query_name}] Начало выполнения {len(statements)} выражений ({len(groups)} обращений)")
+                transaction = connection.transaction()
+                await transaction.start()
+                try:
+                    for group in groups:
+                        statement = group[0]
+                        command = ', '.join(item.info.command for item in group)
+                        rows_affected = None
+                        statement_start = loop.time()
+                        with TRACER.span(command, statement=number, count=len(group)):
+                            if len(group) > 1:
+                                # Простой протокол: все выражения группы за одно обращение, статус только последнего
+                                with timer.phase('server_exec'):
+                                    await connection.execute(';\n'.join(item.text for item in group),
+                                                             timeout=self._deadline(timeout))
+                            elif statement.info.returns_rows:
+                                with timer.phase('server_exec'):
+                                    rows = await connection.fetch(statement.text, *(statement.bind(params) or []),
+                                                                  timeout=self._deadline(timeout))
+                                result.columns = await self._result_columns(
+                                    connection, statement.text, rows, fmt, timeout=self._deadline(timeout))
+                                with timer.phase('decode'):
+                                    result.data = convert_rows(rows, fmt, result.columns)
+                                rows_affected = len(rows)
+                            else:
+                                with timer.phase('server_exec'):
+                                    status = await connection.execute(statement.text, *(statement.bind(params) or []),
+                                                                      timeout=self._deadline(timeout))
+                                rows_affected = self._status_rows(status)
+                        result.statements.append({
+                            'statement': number,
+                            'count': len(group),
+                            'command': command,
+                            'rows': rows_affected,
+                            'execution_time': loop.time() - statement_start
+                        })
+                        result.rows_affected += rows_affected or 0
+                        number += len(group)
+                except BaseException:
+                    await transaction.rollback()
+                    raise
+                with timer.phase('commit'):
+                    await transaction.commit()
+                result.success = True
+
+        except asyncio.TimeoutError:
+            error_msg = f"Выражение {number}: таймаут выполнения ({timeout or self.command_timeout} сек)"
+            logger.error(f"[{query_name}] {error_msg}")
+            result.error = error_msg
+        except Exception as e:
+            logger.error(f"[{query_name}] Ошибка при выполнении выражения {number}: {e}")
+            result.error = f"Выражение {number}: {e}"
+            result.sqlstate = error_sqlstate(e)
+        finally:
+            result.execution_time = loop.time() - start_time
+            result.completed_at = datetime.utcnow()
+            logger.info(
+                f"[{query_name}] Выполнено {len(result.statements)} обращений, "
+                f"обработано {result.rows_affected} строк за {result.execution_time:.2f} сек"
+            )
+        
+        return result
+
+    async def _stream_query(
+        self,
+        connection: asyncpg.Connection,
+        sql: str,
+        params: Optional[List[Any]],
+        chunk_size: int,
+        consumer: Optional[Callable[[List[asyncpg.Record]], Any]] = None,
+        timer: Optional[PhaseTimer] = None,
+        consumer_phase: str = 'sink_write',
+        timeout: Optional[float] = None
+    ) -> int:
+        """
+        Чтение результата серверным курсором порциями по chunk_size строк.
+        Каждая порция передается в consumer и после этого освобождается.
+        timeout ограничивает каждое обращение к серверу (открытие курсора и получение порции).
+        
+        Returns:
+            Общее количество полученных строк
+        """
+        timer = timer or PhaseTimer()
+        total = 0
+        # Серверный курсор asyncpg существует только внутри транзакции
+        transaction = connection.transaction()
+        await transaction.start()
+        try:
+            with timer.phase('server_exec'):
+                cursor = await connection.cursor(sql, *(params or []), timeout=timeout)
+            while True:
+                with timer.phase('fetch_transfer'):
+                    rows = await cursor.fetch(chunk_size, timeout=timeout)
+                if not rows:
+                    break
+                total += len(rows)
+                if consumer:
+                    with timer.phase(consumer_phase):
+                        handled = consumer(rows)
+                        if inspect.isawaitable(handled):
+                            await handled
+        except BaseException:
+            await transaction.rollback()
+            raise
+        with timer.phase('commit'):
+            await transaction.commit()
+        return total
+
+    async def export_query(
+        self,
+        sql: str,
+        file_path: str,
+        query_name: str = "Unnamed Export",
+        params: Optional[List[Any]] = None,
+        options: Optional[Dict[str, Any]] = None,
+        timeout: Optional[int] = None
+    ) -> QueryResult:
+        """
+        Выгрузка результата запроса в файл через COPY (<sql>) TO STDOUT.
+        Данные пишутся в файл напрямую из протокола COPY, без создания строк Python.
+        
+        Args:
+            sql: SQL запрос
+            file_path: Путь к файлу выгрузки
+            query_name: Имя запроса для логирования
+            params: Параметры запроса
+            options: Параметры COPY (format, header, delimiter, null, encoding)
+            timeout: Таймаут выполнения (секунды)
+            
+        Returns:
+            QueryResult с количеством строк, байт и пропускной способностью
+        """
+        timer = PhaseTimer()
+        result = QueryResult(
+            query_name=query_name,
+            success=False,
+            execution_time=0,
+            started_at=datetime.utcnow(),
+            phases=timer.phases
+        )
+        
+        start_time = asyncio.get_event_loop().time()
+        
+        try:
+            if not self.connection_pool:
+                raise RuntimeError("Пул соединений не инициализирован.")
+
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            async with self._acquire(timer, timeout) as connection:
+                logger.info(f"[{query_name}] Начало выгрузки в {file_path}")
+                # COPY TO STDOUT передает данные по мере выполнения: фазы не разделяются
+                with timer.phase('server_exec'):
+                    status = await connection.copy_from_query(
+                        sql.strip().rstrip(';'),
+                        *(params or []),
+                        output=file_path,
+                        timeout=self._deadline(timeout),
+                        **(options or {})
+                    )
+                result.rows_affected = copy_rows(status)
+                result.bytes_written = os.path.getsize(file_path)
+                result.success = True
+
+        except Exception as e:
+            logger.error(f"[{query_name}] Ошибка при выгрузке: {e}")
+            result.error = str(e)
+            result.sqlstate = error_sqlstate(e)
+        finally:
+            result.execution_time = asyncio.get_event_loop().time() - start_time
+            result.completed_at = datetime.utcnow()
+            result.throughput = throughput_mb(result.bytes_written, result.execution_time)
+            logger.info(
+                f"[{query_name}] Выгружено {result.rows_affected} строк, "
+                f"{result.bytes_written} байт за {result.execution_time:.2f} сек "
+                f"({result.throughput:.2f} МБ/сек)"
+            )
+        
+        return result
+
+    async def load_table(
+        self,
+        table: str,
+        file_pattern: str,
+        query_name: str = "Unnamed Load",
+        schema: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+        options: Optional[Dict[str, Any]] = None,
+        timeout: Optional[int] = None
+    ) -> QueryResult:
+        """
+        Загрузка файлов в таблицу через COPY ... FROM STDIN.
+        Файлы читаются блоками по copy_chunk_size байт и целиком в память не загружаются.
+        Все файлы загружаются в одной транзакции.
+        
+        Args:
+            table: Целевая таблица
+            file_pattern: Путь к файлу или glob-шаблон
+            query_name: Имя задания для логирования
+            schema: Схема целевой таблицы
+            columns: Список колонок
+            options: Параметры COPY (format, header, delimiter, null, encoding)
+            timeout: Таймаут загрузки одного файла (секунды)
+            
+        Returns:
+            QueryResult со статистикой по каждому файлу в files
+        """
+        timer = PhaseTimer()
+        result = QueryResult(
+            query_name=query_name,
+            success=False,
+            execution_time=0,
+            started_at=datetime.utcnow(),
+            files=[],
+            phases=timer.phases
+        )
+        
+        start_time = asyncio.get_event_loop().time()
+        
+        try:
+            if not self.connection_pool:
+                raise RuntimeError("Пул соединений не инициализирован.")
+
+            files = load_files(file_pattern)
+
+            async with self._acquire(timer, timeout) as connection:
+                transaction = connection.transaction()
+                await transaction.start()
+                try:
+                    for file_path in files:
+                        logger.info(f"[{query_name}] Загрузка {file_path} в {table}")
+                        file_start = asyncio.get_event_loop().time()
+                        with timer.phase('server_exec'):
+                            status = await connection.copy_to_table(
+                                table,
+                                source=self._read_file_chunks(file_path),
+                                schema_name=schema,
+                                columns=columns,
+                                timeout=self._deadline(timeout),
+                                **(options or {})
+                            )
+                        stats = file_stats(
+                            file_path,
+                            copy_rows(status),
+                            os.path.getsize(file_path),
+                            asyncio.get_event_loop().time() - file_start
+                        )
+                        result.files.append(stats)
+                        result.rows_affected += stats['rows']
+                        result.bytes_written += stats['bytes']
+                        logger.info(
+                            f"[{query_name}] {file_path}: {stats['rows']} строк, "
+                            f"{stats['rows_per_sec']:.0f} строк/сек, {stats['mb_per_sec']:.2f} МБ/сек"
+                        )
+                except BaseException:
+                    await transaction.rollback()
+                    raise
+                with timer.phase('commit'):
+                    await transaction.commit()
+                result.success = True
+
+        except Exception as e:
+            logger.error(f"[{query_name}] Ошибка при загрузке: {e}")
+            result.error = str(e)
+            result.sqlstate = error_sqlstate(e)
+        finally:
+            result.execution_time = asyncio.get_event_loop().time() - start_time
+            result.completed_at = datetime.utcnow()
+            result.throughput = throughput_mb(result.bytes_written, result.execution_time)
+            logger.info(
+                f"[{query_name}] Загружено {result.rows_affected} строк за "
+                f"{result.execution_time:.2f} сек ({result.throughput:.2f} МБ/сек)"
+            )
+        
+        return result
+
+    async def _read_file_chunks(self, file_path: str) -> AsyncIterator[bytes]:
+        """Чтение файла блоками в пуле потоков, не блокируя цикл событий"""
+        loop = asyncio.get_running_loop()
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, self.copy_chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    async def execute_batch(
+        self,
+        sql: str,
+        params_batch: Iterable[Sequence[Any]],
+        query_name: str = "Unnamed Batch",
+        batch_size: Optional[int] = None,
+        timeout: Optional[int] = None
+    ) -> QueryResult:
+        """
+        Выполнение одного запроса для множества наборов параметров через executemany.
+        Запрос подготавливается один раз, наборы параметров отправляются порциями
+        по batch_size, каждая порция фиксируется отдельной транзакцией.
+        
+        Args:
+            sql: SQL запрос
+            params_batch: Наборы параметров (читаются лениво)
+            query_name: Имя запроса для логирования
+            batch_size: Размер порции наборов параметров
+            timeout: Таймаут выполнения одной порции (секунды)
+            
+        Returns:
+            QueryResult, где rows_affected - количество обработанных наборов параметров,
+            chunks - статистика по каждой порции
+        """
+        timer = PhaseTimer()
+        result = QueryResult(
+            query_name=query_name,
+            success=False,
+            execution_time=0,
+            started_at=datetime.utcnow(),
+            chunks=[],
+            phases=timer.phases
+        )
+        
+        loop = asyncio.get_event_loop()
+        start_time = loop.time()
+        
+        try:
+            if not self.connection_pool:
+                raise RuntimeError("Пул соединений не инициализирован.")
+
+            async with self._acquire(timer, timeout) as connection:
+                logger.info(f"[{query_name}] Начало пакетного выполнения SQL")
+                with timer.phase('server_exec'):
+                    statement = await connection.prepare(sql)
+                for number, chunk in enumerate(batched(params_batch, batch_size or self.params_batch_size), 1):
+                    chunk_start = loop.time()
+                    transaction = connection.transaction()
+                    await transaction.start()
+                    try:
+                        with timer.phase('server_exec'):
+                            await statement.executemany(chunk, timeout=self._deadline(timeout))
+                    except BaseException:
+                        await transaction.rollback()
+                        raise
+                    with timer.phase('commit'):
+                        await transaction.commit()
+                    result.chunks.append({
+                        'chunk': number,
+                        'rows': len(chunk),
+                        'execution_time': loop.time() - chunk_start
+                    })
+                    result.rows_affected += len(chunk)
+                result.success = True
+
+        except Exception as e:
+            failed_chunk = len(result.chunks) + 1
+            logger.error(f"[{query_name}] Ошибка при выполнении порции {failed_chunk}: {e}")
+            result.error = f"Порция {failed_chunk}: {e}"
+            result.sqlstate = error_sqlstate(e)
+        finally:
+            result.execution_time = loop.time() - start_time
+            result.completed_at = datetime.utcnow()
+            logger.info(
+                f"[{query_name}] Обработано {result.rows_affected} наборов параметров "
+                f"в {len(result.chunks)} порциях за {result.execution_time:.2f} сек"
+            )
+        
+        return result
+
+    async def execute_to_sink(
+        self,
+        sql: str,
+        sink_config: Dict[str, Any],
+        query_name: str = "Unnamed Query",
+        params: Optional[List[Any]] = None,
+        timeout: Optional[int] = None,
+        chunk_size: Optional[int] = None
+    ) -> QueryResult:
+        """
+        Потоковое выполнение запроса с записью результата в приемник (секция sink).
+        Порции строк пишутся в файл по мере получения в пуле потоков,
+        не блокируя цикл событий.
+        """
+        try:
+            sink = create_sink(sink_config, query_name)
+        except (ValueError, RuntimeError) as e:
+            logger.error(f"[{query_name}] Ошибка настройки sink: {e}")
+            return QueryResult(query_name=query_name, success=False, execution_time=0, error=str(e))
+
+        loop = asyncio.get_running_loop()
+
+        async def consumer(rows: List[asyncpg.Record]) -> None:
+            await loop.run_in_executor(None, sink.write, rows)
+
+        try:
+            result = await self.execute_query(
+                sql=sql,
+                query_name=query_name,
+                params=params,
+                timeout=timeout,
+                fetch='stream',
+                chunk_size=chunk_size,
+                consumer=consumer
+            )
+        finally:
+            await loop.run_in_executor(None, sink.close)
+
+        result.files = sink.files
+        result.bytes_written = sink.bytes_written
+        result.throughput = throughput_mb(sink.bytes_written, result.execution_time)
+        return result
+
+    async def execute_script(self, key: str, query_data: Dict[str, Any]) -> QueryResult:
+        """Выполнение скрипта из scripts.yml в зависимости от его типа"""
+        metrics.QUERIES_IN_FLIGHT.inc(executor='async')
+        try:
+            with TRACER.span(query_data.get('name', key), new_track=True, key=key) as span:
+                result = await self._run_script(key, query_data)
+                if span:
+                    span.set(success=result.success, rows=result.rows_affected, bytes=result.bytes_written,
+                             error=result.error)
+        finally:
+            metrics.QUERIES_IN_FLIGHT.dec(executor='async')
+        metrics.observe_script(result.query_name, result.success, result.skipped,
+                               result.execution_time, result.rows_affected)
+        return result
+
+    async def _run_script(self, key: str, query_data: Dict[str, Any]) -> QueryResult:
+        query_name = query_data.get('name', key)
+        script_type = query_data.get('type')
+        if script_type in ('export', 'load'):
+            try:
+                options = copy_options(query_data)
+            except ValueError as e:
+                return QueryResult(query_name=query_name, success=False, execution_time=0, error=str(e))
+        if script_type == 'load':
+            return await self.load_table(
+                table=query_data.get('table', ''),
+                file_pattern=query_data.get('file', ''),
+                query_name=query_name,
+                schema=query_data.get('schema'),
+                columns=query_data.get('columns'),
+                options=options,
+                timeout=query_data.get('timeout')
+            )
+        if query_data.get('sink'):
+            return await self.execute_to_sink(
+                sql=query_data.get('sql', ''),
+                sink_config=query_data['sink'],
+                query_name=query_name,
+                params=query_data.get('params'),
+                timeout=query_data.get('timeout'),
+                chunk_size=query_data.get('chunk_size')
+            )
+        if query_data.get('params_batch') is not None:
+            try:
+                params_batch = iter_params(query_data)
+            except ValueError as e:
+                return QueryResult(query_name=query_name, success=False, execution_time=0, error=str(e))
+            return await self.execute_batch(
+                sql=query_data.get('sql', ''),
+                params_batch=params_batch,
+                query_name=query_name,
+                batch_size=query_data.get('batch_size'),
+                timeout=query_data.get('timeout')
+            )
+        if query_data.get('split'):
+            try:
+                pipeline = split_mode(query_data['split']) == 'pipeline'
+            except ValueError as e:
+                return QueryResult(query_name=query_name, success=False, execution_time=0, error=str(e))
+            return await self.execute_statements(
+                sql=query_data.get('sql', ''),
+                query_name=query_name,
+                params=query_data.get('params'),
+                timeout=query_data.get('timeout'),
+                pipeline=pipeline,
+                row_format=query_data.get('row_format')
+            )
+        if script_type == 'export':
+            return await self.export_query(
+                sql=query_data.get('sql', ''),
+                file_path=query_data.get('file', ''),
+                query_name=query_name,
+                params=query_data.get('params'),
+                options=options,
+                timeout=query_data.get('timeout')
+            )
+        return await self.execute_query(
+            sql=query_data.get('sql', ''),
+            query_name=query_name,
+            params=query_data.get('params'),
+            timeout=query_data.get('timeout'),
+            fetch=query_data.get('fetch'),
+            chunk_size=query_data.get('chunk_size'),
+            row_format=query_data.get('row_format'),
+            spill_threshold=query_data.get('spill_threshold')
+        )
+    
     async def execute_queries_concurrently(
         self,
         queries: Dict[str, Dict[str, Any]],
-        max_concurrent: Optional[int] = None
+        max_concurrent: Optional[int] = None,
+        durations: Optional[Dict[str, float]] = None
     ) -> List[QueryResult]:
         """
-        Параллельное выполнение нескольких SQL запросов
+        Параллельное выполнение нескольких SQL запросов с учетом зависимостей (depends_on).
+        Скрипт запускается, как только успешно выполнены все его зависимости;
+        скрипты, зависящие от завершившихся с ошибкой, пропускаются.
+        После временной ошибки (политика retry) скрипт ждет задержку вне ограничения
+        одновременных запросов и возвращается в очередь готовых.
         
         Args:
             queries: Словарь запросов
             max_concurrent: Максимальное количество одновременно выполняемых запросов
+            durations: Ожидаемая длительность скриптов (первыми запускаются самые долгие)
             
         Returns:
             Список результатов выполнения
@@ -229,52 +951,74 @@ class PostgresExecutorAsync:
             logger.warning("Нет запросов для выполнения")
             return []
         
-        logger.info(f"Запуск {len(queries)} асинхронных запросов...")
+        graph = ScriptGraph(queries, durations)
+        limit = max_concurrent or self.concurrent_max
         
-        # Создаем задачи для всех запросов
-        tasks = []
-        for key, query_data in queries.items():
-            task = self.execute_query(
-                sql=query_data.get('sql', ''),
-                query_name=query_data.get('name', key),
-                params=query_data.get('params'),
-                timeout=query_data.get('timeout')
-            )
-            tasks.append(task)
+        logger.info(f"Запуск {len(queries)} асинхронных запросов (одновременно до {limit})...")
         
-        # Используем семафор для ограничения одновременных запросов
-        max_concurrent_on = max_concurrent or self.max_connections
-        if max_concurrent:
-            semaphore = asyncio.Semaphore(max_concurrent)
+        results: Dict[str, QueryResult] = {}
+        running: Dict[asyncio.Task, str] = {}
+        # Ожидание перед повтором не занимает место среди выполняющихся запросов
+        backoff: Dict[asyncio.Task, str] = {}
+        attempts: Dict[str, int] = {}
+        default = default_policy()
+        
+        while graph.has_ready() or running or backoff:
+            # Запускаем готовые скрипты в пределах ограничения
+            while graph.has_ready() and len(running) < limit:
+                key = graph.pop_ready()
+                attempts[key] = attempts.get(key, 0) + 1
+                running[asyncio.create_task(self.execute_script(key, queries[key]))] = key
             
-            async def limited_task(task: asyncio.Task) -> QueryResult:
-                async with semaphore:
-                    return await task
+            done, _ = await asyncio.wait({**running, **backoff}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task in backoff:
+                    graph.requeue(backoff.pop(task))
+                    continue
+                key = running.pop(task)
+                query_name = queries[key].get('name', key)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    result = QueryResult(
+                        query_name=query_name,
+                        success=False,
+                        execution_time=0,
+                        error=str(e),
+                        started_at=datetime.utcnow(),
+                        completed_at=datetime.utcnow()
+                    )
+                result.attempts = attempts[key]
                 
-            limited_tasks = [limited_task(asyncio.create_task(t)) for t in tasks]
-            results = await asyncio.gather(*limited_tasks, return_exceptions=True)
-        else:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Обрабатываем исключения
-        processed_results = []
-        for i, result in enumerate(results):
-            query_name = list(queries.keys())[i]
-            if isinstance(result, Exception):
-                processed_results.append(QueryResult(
-                    query_name=query_name,
-                    success=False,
-                    execution_time=0,
-                    error=str(result),
-                    started_at=datetime.utcnow(),
-                    completed_at=datetime.utcnow()
-                ))
-            else:
-                processed_results.append(result)
+                delay = self.retry_delay(queries[key], result, default)
+                if delay is not None:
+                    backoff[asyncio.create_task(asyncio.sleep(delay))] = key
+                    continue
+                results[key] = result
+                
+                for skipped_key, failed_key in graph.complete(key, result.success):
+                    logger.warning(f"[{queries[skipped_key].get('name', skipped_key)}] Пропущен: "
+                                   f"не выполнена зависимость '{failed_key}'")
+                    results[skipped_key] = QueryResult(
+                        query_name=queries[skipped_key].get('name', skipped_key),
+                        success=False,
+                        execution_time=0,
+                        error=f"Пропущен: не выполнена зависимость '{failed_key}'",
+                        skipped=True
+                    )
+                    metrics.observe_script(results[skipped_key].query_name, False, True, 0, 0)
         
         logger.info("Все асинхронные запросы завершены")
-        return processed_results
+        return [results[key] for key in queries if key in results]
         
+    @staticmethod
+    def retry_delay(query_data: Dict[str, Any], result: QueryResult, default: RetryPolicy) -> Optional[float]:
+        """Задержка перед повтором скрипта после неудачной попытки или None, если повтор не нужен"""
+        # Порции params_batch фиксируются по отдельности: повтор продублировал бы уже записанные
+        if result.success or result.skipped or result.chunks:
+            return None
+        return next_delay(query_data, result.query_name, result.attempts, result.sqlstate, default)
+
     async def execute_transaction(
         self,
         queries: List[Dict[str, Any]]
@@ -300,9 +1044,7 @@ class PostgresExecutorAsync:
                         
                         start_time = asyncio.get_event_loop().time()
                         try:
-                            is_select = sql.strip().upper().startswith('SELECT')
-                            
-                            if is_select:
+                            if classify_sql(sql).returns_rows:
                                 rows = await conn.fetch(sql, *params) if params else await conn.fetch(sql)
                                 data = [dict(row) for row in rows]
                                 rows_affected = len(data)
@@ -350,7 +1092,13 @@ class PostgresRunAsync:
     async def run_async(
         database_params: Optional[Dict[str, Any]] = None,
         scripts_data: Optional[Dict[str, Dict[str, Any]]] = None,
-        max_concurrent: Optional[int] = None
+        max_concurrent: Optional[int] = None,
+        min_connections: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        log_results: bool = True,
+        record_history: bool = True,
+        export_metrics: bool = True,
+        export_trace: bool = True
     ) -> List[QueryResult]:
         """
         Асинхронное выполнение SQL запросов
@@ -359,11 +1107,19 @@ class PostgresRunAsync:
             database_params: Параметры подключения к БД
             scripts_data: Словарь с SQL скриптами
             max_concurrent: Максимальное количество одновременных запросов
+            min_connections: Минимальный размер пула (по умолчанию из настроек)
+            max_connections: Максимальный размер пула (по умолчанию из настроек)
+            log_results: Выводить итоговую сводку в лог
+            record_history: Сохранять длительность выполнения в историю
+            export_metrics: Экспортировать метрики (METRICS_PORT, METRICS_TEXTFILE)
+            export_trace: Записать трассировку запуска в TRACE_FILE
             
         Returns:
             Список результатов
         """
         executor = None
+        if export_trace:
+            TRACER.start(settings.TRACE_FILE)
         
         try:
             # Логирование начала выполнения
@@ -371,22 +1127,40 @@ class PostgresRunAsync:
             logger.info("Начало асинхронного выполнения SQL-скриптов")
             logger.info("=" * 50)
             
+            if export_metrics:
+                metrics.start_http_server(settings.METRICS_PORT)
+            
             # Используем настройки по умолчанию или переданные параметры
             db_params = database_params or settings.DATABASE_PARAMS
             scripts_to_run = scripts_data or scripts.scripts
             
             # Создаем и инициализируем исполнитель
-            executor = PostgresExecutorAsync(**db_params)
+            executor = PostgresExecutorAsync(
+                **db_params,
+                min_connections=min_connections,
+                max_connections=max_connections
+            )
             await executor.initialize()
             
+            # Порядок запуска определяется историей длительности выполнения
+            history = ExecutionHistory()
+            
             # Выполняем запросы параллельно
-            results = await executor.execute_queries_concurrently(
-                queries=scripts_to_run,
-                max_concurrent=max_concurrent
-            )
+            with TRACER.span('run_async', scripts=len(scripts_to_run)) as span:
+                results = await executor.execute_queries_concurrently(
+                    queries=scripts_to_run,
+                    max_concurrent=max_concurrent,
+                    durations=history.durations(scripts_to_run)
+                )
+                if span:
+                    span.set(success=sum(1 for result in results if result and result.success))
+            
+            if record_history:
+                PostgresRunAsync._record_history(history, results)
             
             # Логирование результатов
-            await PostgresRunAsync._log_results(results)
+            if log_results:
+                await PostgresRunAsync._log_results(results)
             
             return results
             
@@ -394,10 +1168,22 @@ class PostgresRunAsync:
             logger.error(f"Критическая ошибка: {e}")
             raise
         finally:
+            if export_metrics:
+                metrics.write_textfile(settings.METRICS_TEXTFILE)
+            if export_trace:
+                TRACER.write()
             # Закрываем соединения
             if executor:
                 await executor.close()
     
+    @staticmethod
+    def _record_history(history: ExecutionHistory, results: List[QueryResult]) -> None:
+        """Сохранение длительности успешно выполненных запросов"""
+        for result in results:
+            if result and result.success:
+                history.record(result.query_name, result.execution_time)
+        history.save()
+
     @staticmethod
     async def _log_results(results: List[QueryResult]) -> None:
         """Логирование результатов выполнения"""
@@ -409,12 +1195,22 @@ class PostgresRunAsync:
         success_count = 0
         for result in results:
             if result != None:
-                status = "УСПЕХ" if result.success else "ОШИБКА"
+                status = "УСПЕХ" if result.success else ("ПРОПУЩЕН" if result.skipped else "ОШИБКА")
                 logger.info("")
                 logger.info(f"Запрос: {result.query_name}")
                 logger.info(f"Статус: {status}")
                 logger.info(f"Время выполнения: {result.execution_time:.2f} сек")
                 logger.info(f"Строк обработано: {result.rows_affected}")
+                if result.attempts > 1:
+                    logger.info(f"Попыток: {result.attempts}")
+                if result.bytes_written:
+                    logger.info(f"Записано: {result.bytes_written} байт ({result.throughput:.2f} МБ/сек)")
+                if result.phases:
+                    logger.info(f"Фазы (сек): {PhaseTimer.format(result.phases)}")
+                for entry in result.statements or []:
+                    rows = '-' if entry['rows'] is None else entry['rows']
+                    logger.info(f"  Выражение {entry['statement']} ({entry['command']}): "
+                                f"строк {rows}, {entry['execution_time']:.3f} сек")
                 
                 if result.success:
                     success_count += 1
@@ -450,15 +1246,178 @@ scripts:
     name: "Выполнение запроса"
     type: select
     params: [true]  # параметры для запроса
+    depends_on: ["Проверка подключения"]  # опционально, запуск после успешного выполнения
+
+  "Большой отчет":
+    sql: |
+      SELECT * FROM big_table
+    fetch: stream      # опционально, чтение серверным курсором порциями
+    chunk_size: 5000   # опционально, размер порции (ASYNC_STREAM_CHUNK_SIZE)
+    sink:              # опционально, запись результата в файл по мере получения
+      path: /app/export/{name}_{timestamp}.csv.gz
+      format: csv      # csv, jsonl или parquet (нужен pyarrow)
+      max_rows: 1000000  # опционально, ротация файлов (также max_bytes)
+
+  "Выгрузка заказов":
+    sql: |
+      SELECT * FROM orders
+    type: export
+    file: /app/export/orders.csv
+    format: csv        # csv, text, tsv или binary
+    header: true       # опционально, только для csv
+
+  "Пакетная вставка":
+    sql: |
+      INSERT INTO events (id, payload) VALUES ($1, $2)
+    params_batch: /app/import/events.jsonl  # или список наборов: [[1, "a"], [2, "b"]]
+    batch_size: 1000   # опционально, размер порции (PARAMS_BATCH_SIZE)
+
+  "Обновление витрины":
+    sql: |
+      DELETE FROM mart WHERE day = $1;
+      INSERT INTO mart SELECT * FROM staging WHERE day = $1;
+      ANALYZE mart;
+    params: ["2024-01-01"]
+    split: true        # выражения по отдельности в одной транзакции (или pipeline)
+
+  "Загрузка staging":
+    type: load
+    table: staging_orders
+    schema: public     # опционально
+    file: /app/import/orders_*.csv  # путь или glob-шаблон
+    format: csv
+    header: true
 
 Для запуска используйте:
     results = await PostgresAsyncRunner.run_async()
 """
 
+    @staticmethod
+    def run_multiprocess(
+        processes: int,
+        scripts_data: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_concurrent: Optional[int] = None
+    ) -> List[QueryResult]:
+        """
+        Выполнение SQL запросов в нескольких процессах.
+        Скрипты распределяются по процессам равномерно, связанные зависимостями
+        (depends_on) скрипты попадают в один процесс. Каждый процесс работает со своим
+        циклом событий и пулом соединений. Суммарное количество соединений и
+        одновременных запросов по всем процессам не превышает настроек.
+        
+        Args:
+            processes: Количество процессов
+            scripts_data: Словарь с SQL скриптами
+            max_concurrent: Максимальное количество одновременных запросов (на все процессы)
+            
+        Returns:
+            Список результатов в порядке скриптов
+        """
+        scripts_to_run = scripts_data or scripts.scripts
+        keys = list(scripts_to_run.keys())
+        if not keys:
+            logger.warning("Нет запросов для выполнения")
+            return []
+
+        # Связанные зависимостями скрипты выполняются в одном процессе;
+        # группы распределяются по процессам по ожидаемой длительности (LPT)
+        history = ExecutionHistory()
+        durations = history.durations(scripts_to_run)
+        try:
+            graph = ScriptGraph(scripts_to_run)
+        except ValueError as e:
+            # Циклы и неизвестные зависимости - как в run_async
+            logger.error(f"Критическая ошибка: {e}")
+            raise
+        groups = sorted(
+            graph.components(),
+            key=lambda group: (sum(durations[key] for key in group), len(group)),
+            reverse=True
+        )
+        limit = max_concurrent or settings.ASYNC_CONCURRENT_MAX
+        # Процессов не больше одновременных запросов: иначе каждый получит минимум один и лимит будет превышен
+        processes = max(1, min(processes, settings.DATABASE_CONNECTIONS_MAX, limit, len(groups)))
+
+        max_connections = max(1, settings.DATABASE_CONNECTIONS_MAX // processes)
+        min_connections = min(settings.DATABASE_CONNECTIONS_MIN, max_connections)
+        concurrent = max(1, limit // processes)
+
+        shards: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(processes)]
+        loads = [0.0] * processes
+        for group in groups:
+            i = min(range(processes), key=lambda n: (loads[n], len(shards[n])))
+            shards[i].update((key, scripts_to_run[key]) for key in group)
+            loads[i] += sum(durations[key] for key in group)
+
+        metrics.start_http_server(settings.METRICS_PORT)
+        TRACER.start(settings.TRACE_FILE)
+
+        logger.info("=" * 50)
+        logger.info(f"Запуск {len(keys)} скриптов в {processes} процессах "
+                    f"(до {max_connections} соединений на процесс)")
+        logger.info("=" * 50)
+
+        # Модули процессов нужны только в этом режиме
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Результаты с ключами скриптов: имена (query_name) могут совпадать
+        keyed: List[Tuple[str, QueryResult]] = []
+        # spawn: дочерние процессы не наследуют цикл событий и потоки родителя
+        context = multiprocessing.get_context('spawn')
+        # Логи дочерних процессов пишет родитель: ротация файла несколькими процессами не работает
+        process_queue, process_listener = start_process_listener(context)
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                 initializer=use_process_queue, initargs=(process_queue,)) as pool, \
+                TRACER.span('run_multiprocess', scripts=len(keys), processes=processes):
+            futures = [
+                pool.submit(_run_shard, shard, min_connections, max_connections, concurrent, TRACER.enabled)
+                for shard in shards
+            ]
+            for shard, future in zip(shards, futures):
+                try:
+                    shard_results, shard_events = future.result()
+                    # run_async возвращает результаты в порядке ключей скриптов процесса
+                    keyed.extend(zip(shard.keys(), shard_results))
+                    TRACER.extend(shard_events)
+                except Exception as e:
+                    logger.error(f"Ошибка процесса-исполнителя: {e}")
+                    keyed.extend(
+                        (key, QueryResult(
+                            query_name=query_data.get('name', key),
+                            success=False,
+                            execution_time=0,
+                            error=str(e)
+                        ))
+                        for key, query_data in shard.items()
+                    )
+        process_listener.stop()
+
+        order = {key: i for i, key in enumerate(keys)}
+        keyed.sort(key=lambda item: order[item[0]])
+        results = [result for _, result in keyed]
+
+        PostgresRunAsync._record_history(history, results)
+        
+        # Метрики дочерних процессов не передаются, в родителе учитываются итоговые результаты
+        for result in results:
+            metrics.observe_script(result.query_name, result.success, result.skipped,
+                                   result.execution_time, result.rows_affected)
+        metrics.write_textfile(settings.METRICS_TEXTFILE)
+        # Интервалы дочерних процессов выводятся в trace-файле отдельными процессами (pid)
+        TRACER.write()
+        
+        asyncio.run(PostgresRunAsync._log_results(results))
+        return results
+
     # Статический метод запуска
     @staticmethod
     def run():
 
+        if settings.ASYNC_PROCESSES > 1:
+            PostgresRunAsync.run_multiprocess(settings.ASYNC_PROCESSES)
+            return
+
         async def _run() -> List[QueryResult]:
             return await PostgresRunAsync.run_async()
         
@@ -494,4 +1453,32 @@ scripts:
     #     results = asyncio.run(_run())
         
     #     # Конвертируем в словари для обратной совместимости
-    #     return [result.to_dict() for result in results]
\ No newline at end of file
+    #     return [result.to_dict() for result in results]
+
+
+def _run_shard(
+    scripts_data: Dict[str, Dict[str, Any]],
+    min_connections: int,
+    max_connections: int,
+    max_concurrent: Optional[int],
+    trace: bool = False
+) -> Tuple[List[QueryResult], List[Dict[str, Any]]]:
+    """
+    Выполнение части скриптов в дочернем процессе (PostgresRunAsync.run_multiprocess).
+    Возвращает результаты и события трассировки процесса.
+    """
+    TRACER.start(enabled=trace)
+    results = asyncio.run(PostgresRunAsync.run_async(
+        scripts_data=scripts_data,
+        max_concurrent=max_concurrent,
+        min_connections=min_connections,
+        max_connections=max_connections,
+        log_results=False,
+        record_history=False,
+        export_metrics=False,
+        export_trace=False
+    ))
+    # asyncpg.Record не сериализуется pickle, такие строки передаются кортежами
+    for result in results:
+        result.data = portable_data(result.data)
+    return results, TRACER.events()
\ No newline at end of file
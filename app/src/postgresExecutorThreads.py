@@ -1,24 +1,55 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Iterable, Iterator, Sequence
 from psycopg2 import pool
+from psycopg2 import sql as pgsql
 import psycopg2.extras
 import threading
+import os
 import time
+import uuid
 from src.logger import logger
 from src.databaseSettings import settings
 from src.parseScripts import scripts
+from src.copyCommand import copy_options, copy_options_sql, throughput_mb, load_files, file_stats
+from src.scriptScheduler import ScriptGraph
+from src.executionHistory import ExecutionHistory
+from src.paramsSource import iter_params, batched
+from src.resultSinks import create_sink
+from src.rowFormats import ColumnarResult, row_format as check_row_format
+from src.spillStorage import SpillBuffer
+from src.phaseTimer import PhaseTimer
+from src.spanTracer import TRACER
+from src.sqlClassifier import classify_sql, split_statements, group_statements, split_mode
+from src.retryPolicy import default_policy, next_delay, error_sqlstate
+from src import metrics
+
+# Фабрика курсора psycopg2 для каждого формата строк результата
+CURSOR_FACTORIES = {
+    'dict': psycopg2.extras.RealDictCursor,
+    'tuple': None,
+    'record': psycopg2.extras.NamedTupleCursor,
+    'columnar': None,
+}
 
 class PostgresExecutorThreads:
     """Класс для параллельного выполнения SQL в PostgreSQL"""
     def __init__(self, 
-                 host: str = settings.DATABASE_HOST, 
-                 port: int = settings.DATABASE_PORT, 
-                 database: str = settings.DATABASE_DB, 
-                 user: str = settings.DATABASE_USER, 
-                 password: str = settings.DATABASE_PASSWORD,
-                 min_connections: int = settings.DATABASE_CONNECTIONS_MIN,
-                 max_connections: int = settings.DATABASE_CONNECTIONS_MAX):
-        """
-        Инициализация подключения к PostgreSQL
+                 host: Optional[str] = None, 
+                 port: Optional[int] = None, 
+                 database: Optional[str] = None, 
+                 user: Optional[str] = None, 
+                 password: Optional[str] = None,
+                 min_connections: Optional[int] = None,
+                 max_connections: Optional[int] = None,
+                 stream_itersize: Optional[int] = None,
+                 copy_chunk_size: Optional[int] = None,
+                 acquire_timeout: Optional[int] = None,
+                 page_size: Optional[int] = None,
+                 row_format: Optional[str] = None,
+                 spill_threshold: Optional[int] = None,
+                 spill_dir: Optional[str] = None):
+        """
+        Инициализация подключения к PostgreSQL.
+        Незаданные параметры берутся из настроек (settings) при создании исполнителя
         Args:
             host: Хост БД
             port: Порт БД
@@ -27,25 +58,143 @@ class PostgresExecutorThreads:
             password: Пароль
             min_connections: Минимальное количество соединений в пуле
             max_connections: Максимальное количество соединений в пуле
+            stream_itersize: Размер порции строк для режима fetch: stream
+            copy_chunk_size: Размер блока чтения файла для type: load (байты)
+            acquire_timeout: Таймаут ожидания свободного соединения из пула (секунды)
+            page_size: Размер страницы наборов параметров для пакетного DML
+            row_format: Формат строк результата по умолчанию: dict, tuple, record (namedtuple), columnar
+            spill_threshold: Порог размера результата (байты), после которого строки сбрасываются на диск (0 - выключено)
+            spill_dir: Каталог для временных файлов сброса (по умолчанию системный)
         """
         self.db_params = settings.DATABASE_PARAMS
+        self.min_connections = min_connections or settings.DATABASE_CONNECTIONS_MIN
+        self.max_connections = max_connections or settings.DATABASE_CONNECTIONS_MAX
+        self.stream_itersize = stream_itersize or settings.THREADS_STREAM_ITERSIZE
+        self.copy_chunk_size = copy_chunk_size or settings.COPY_CHUNK_SIZE
+        self.acquire_timeout = acquire_timeout or settings.DATABASE_CONNECTION_TIMEOUT
+        self.page_size = page_size or settings.PARAMS_BATCH_SIZE
+        self.row_format = check_row_format(row_format, settings.RESULT_ROW_FORMAT)
+        self.spill_threshold = settings.RESULT_SPILL_THRESHOLD if spill_threshold is None else spill_threshold
+        self.spill_dir = spill_dir or settings.RESULT_SPILL_DIR
+        self.timeout_grace = settings.DATABASE_TIMEOUT_GRACE
+        # Таймеры отмены запросов по id соединения (для скриптов с timeout)
+        self._deadlines: Dict[int, threading.Timer] = {}
+
+        # ThreadedConnectionPool не ждет освобождения соединения, а сразу бросает PoolError,
+        # поэтому ожидание реализовано семафором по размеру пула
+        self._pool_slots = threading.BoundedSemaphore(self.max_connections)
+        # Учет соединений для метрик пула: выданные потокам и простаивающие в пуле.
+        # ThreadedConnectionPool открывает min_connections сразу и хранит не больше min_connections
+        # возвращенных соединений, остальные закрывает при возврате
+        self._pool_lock = threading.Lock()
+        self._conns_in_use = 0
+        self._conns_idle = self.min_connections
         
         # Создаем пул соединений
         try:
             self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=settings.DATABASE_CONNECTIONS_MIN,
-                maxconn=settings.DATABASE_CONNECTIONS_MAX,
+                minconn=self.min_connections,
+                maxconn=self.max_connections,
                 **self.db_params
             )
             logger.info("Пул соединений с PostgreSQL создан успешно")
+            metrics.POOL_SIZE.set_function(lambda: self._conns_in_use + self._conns_idle, executor='threads')
+            metrics.POOL_IDLE.set_function(lambda: self._conns_idle, executor='threads')
         except Exception as e:
             logger.error(f"Ошибка создания пула соединений: {e}")
             raise
     
+    def _getconn(self, timer: Optional[PhaseTimer] = None, timeout: Optional[float] = None, name: str = ''):
+        """
+        Получение соединения из пула с ожиданием освобождения не дольше acquire_timeout.
+        Для timeout задается statement_timeout соединения и запускается таймер отмены (см. _set_timeout)
+        """
+        start = time.time()
+        if not self._pool_slots.acquire(timeout=self.acquire_timeout):
+            raise pool.PoolError(f"Нет свободного соединения в пуле за {self.acquire_timeout} сек")
+        metrics.POOL_ACQUIRE_WAIT.observe(time.time() - start, executor='threads')
+        try:
+            connection = self.connection_pool.getconn()
+        except Exception:
+            self._pool_slots.release()
+            raise
+        with self._pool_lock:
+            self._conns_in_use += 1
+            self._conns_idle = max(self._conns_idle - 1, 0)
+        if timer:
+            timer.add('acquire_wait', time.time() - start)
+        if timeout:
+            try:
+                self._set_timeout(connection, timeout, name)
+            except Exception:
+                self._putconn(connection, close=True)
+                raise
+        return connection
+
+    def _putconn(self, connection, close: bool = False) -> None:
+        """
+        Возврат соединения в пул. После скрипта с timeout таймер отмены останавливается
+        и statement_timeout сбрасывается; разорванное соединение закрывается и не возвращается в пул
+        """
+        try:
+            deadline = self._deadlines.pop(id(connection), None)
+            if deadline:
+                deadline.cancel()
+                if not close and not connection.closed:
+                    close = not self._reset_timeout(connection)
+            close = close or bool(connection.closed)
+            self.connection_pool.putconn(connection, close=close)
+        finally:
+            with self._pool_lock:
+                self._conns_in_use -= 1
+                if not close and self._conns_idle < self.min_connections:
+                    self._conns_idle += 1
+            self._pool_slots.release()
+
+    def _set_timeout(self, connection, timeout: float, name: str) -> None:
+        """
+        Серверный таймаут (statement_timeout) и клиентский: если сервер не отменил запрос
+        за timeout + DATABASE_TIMEOUT_GRACE, таймер отправляет запрос отмены (connection.cancel)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SET statement_timeout = %s", (int(timeout * 1000),))
+        connection.commit()
+        deadline = threading.Timer(timeout + self.timeout_grace, self._cancel, (connection, timeout, name))
+        deadline.daemon = True
+        self._deadlines[id(connection)] = deadline
+        deadline.start()
+
+    @staticmethod
+    def _cancel(connection, timeout: float, name: str) -> None:
+        """Отмена выполняющегося запроса на сервере (аналог pg_cancel_backend)"""
+        logger.warning(f"[{name}] Запрос не завершился за {timeout} сек, отмена на сервере")
+        try:
+            connection.cancel()
+        except Exception as e:
+            logger.error(f"[{name}] Ошибка отмены запроса: {e}")
+
+    @staticmethod
+    def _reset_timeout(connection) -> bool:
+        """Сброс statement_timeout перед возвратом соединения в пул; False - соединение неисправно"""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET statement_timeout")
+            connection.commit()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Не удалось сбросить statement_timeout, соединение будет закрыто: {e}")
+            return False
+
     def execute_sql(self, 
                     sql_script: str, 
                     thread_name: str,
-                    params: Optional[Dict] = None) -> Dict[str, Any]:
+                    params: Optional[Dict] = None,
+                    fetch: Optional[str] = None,
+                    itersize: Optional[int] = None,
+                    sink: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+                    row_format: Optional[str] = None,
+                    spill_threshold: Optional[int] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         Выполнение SQL-скрипта в отдельном потоке
         
@@ -53,54 +202,148 @@ class PostgresExecutorThreads:
             sql_script: SQL-скрипт для выполнения
             thread_name: Имя потока (для логирования)
             params: Параметры для запроса
+            fetch: Режим получения данных: None - fetchall, 'stream' - именованным курсором порциями
+            itersize: Размер порции строк для режима 'stream'
+            sink: Обработчик порции строк для режима 'stream'
+            row_format: Формат строк в 'data' (по умолчанию формат исполнителя)
+            spill_threshold: Порог сброса результата на диск (байты), по умолчанию порог исполнителя
+            timeout: Таймаут выполнения (секунды): statement_timeout на сервере и отмена запроса
+                     клиентом, если сервер не ответил за timeout + DATABASE_TIMEOUT_GRACE
             
         Returns:
             Словарь с результатами выполнения
         """
         connection = None
         cursor = None
+        autocommit = False
+        timer = PhaseTimer()
         result = {
             'thread_name': thread_name,
             'success': False,
             'execution_time': 0,
             'rows_affected': 0,
             'error': None,
-            'data': None
+            'data': None,
+            'phases': timer.phases
         }
         
         start_time = time.time()
         
         try:
+            # Тип запроса определяется лексическим разбором (с кэшированием по тексту)
+            info = classify_sql(sql_script)
+
             # Получаем соединение из пула
-            connection = self.connection_pool.getconn()
-            cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
+            connection = self._getconn(timer, timeout, thread_name)
+
             logger.info(f"[{thread_name}] Начало выполнения SQL")
+
+            # Именованный курсор psycopg2 - это DECLARE ... CURSOR FOR, допустимый только для SELECT/VALUES/TABLE
+            if fetch == 'stream' and info.declarable:
+                # Потоковое чтение: в памяти не больше одной порции строк
+                for rows in self._stream_rows(connection, sql_script, params, itersize or self.stream_itersize, timer):
+                    result['rows_affected'] += len(rows)
+                    if sink:
+                        with timer.phase('sink_write'):
+                            sink(rows)
+                logger.info(f"[{thread_name}] Получено {result['rows_affected']} строк (stream)")
+                with timer.phase('commit'):
+                    connection.commit()
+                result['success'] = True
+                return result
+
+            fmt = check_row_format(row_format, self.row_format)
+            threshold = self.spill_threshold if spill_threshold is None else spill_threshold
+
+            if threshold and info.declarable:
+                # Чтение именованным курсором со сбросом на диск после превышения порога
+                buffer = SpillBuffer(threshold, fmt, self.spill_dir)
+                # SpillBuffer хранит строки кортежами и собирает словари по columns сам,
+                # поэтому курсор словарей не нужен; для record строки - namedtuple, как без сброса
+                cursor = connection.cursor(
+                    name=f"spill_{uuid.uuid4().hex}",
+                    cursor_factory=CURSOR_FACTORIES['record'] if fmt == 'record' else None
+                )
+                itersize = itersize or self.stream_itersize
+                cursor.itersize = itersize
+                try:
+                    with timer.phase('server_exec'):
+                        if params:
+                            cursor.execute(sql_script, params)
+                        else:
+                            cursor.execute(sql_script)
+                    while True:
+                        with timer.phase('fetch_transfer'):
+                            rows = cursor.fetchmany(itersize)
+                        if not rows:
+                            break
+                        with timer.phase('decode'):
+                            buffer.extend(rows, columns=[column.name for column in cursor.description])
+                except BaseException:
+                    buffer.discard()
+                    raise
+                cursor.close()
+                cursor = None
+                with timer.phase('decode'):
+                    result['data'] = buffer.result()
+                if fmt != 'dict':
+                    result['columns'] = buffer.columns
+                result['rows_affected'] = buffer.length
+                if buffer.spilled:
+                    logger.info(f"[{thread_name}] Результат (~{buffer.estimated_bytes} байт) сброшен на диск")
+                with timer.phase('commit'):
+                    connection.commit()
+                result['success'] = True
+                return result
+
+            if not info.transactional:
+                # VACUUM, CALL, CREATE INDEX CONCURRENTLY и т.п. нельзя выполнять в транзакции
+                connection.autocommit = autocommit = True
+
+            # Для fetch: stream строки передаются обработчику в том же виде, что и из _stream_rows
+            factory = psycopg2.extras.RealDictCursor if fetch == 'stream' else CURSOR_FACTORIES[fmt]
+            cursor = connection.cursor(cursor_factory=factory)
             
-            # Выполняем SQL
-            if params:
-                cursor.execute(sql_script, params)
-            else:
-                cursor.execute(sql_script)
+            # Выполняем SQL; обычный курсор psycopg2 получает весь результат при execute
+            with timer.phase('server_exec'):
+                if params:
+                    cursor.execute(sql_script, params)
+                else:
+                    cursor.execute(sql_script)
             
-            # Если это SELECT запрос - получаем данные
-            if sql_script.strip().upper().startswith('SELECT'):
-                result['data'] = cursor.fetchall()
-                result['rows_affected'] = len(result['data'])
+            # Если запрос вернул строки - получаем данные. description заполняется для любого
+            # выражения с результатом (SELECT, RETURNING, SHOW, ...), в том числе последнего в скрипте
+            if cursor.description is not None and fetch == 'stream':
+                # Результат нельзя читать через DECLARE (INSERT ... RETURNING, SHOW, EXPLAIN, несколько
+                # выражений): строки уже получены клиентом и передаются обработчику порциями
+                itersize = itersize or self.stream_itersize
+                while True:
+                    with timer.phase('decode'):
+                        rows = cursor.fetchmany(itersize)
+                    if not rows:
+                        break
+                    result['rows_affected'] += len(rows)
+                    if sink:
+                        with timer.phase('sink_write'):
+                            sink(rows)
+            elif cursor.description is not None:
+                result['rows_affected'] = self._fetch_rows(cursor, fmt, result, timer)
             else:
                 # Для INSERT/UPDATE/DELETE получаем количество измененных строк
                 result['rows_affected'] = cursor.rowcount
             
             logger.info(f"[{thread_name}] Получено\Обработано {result['rows_affected']} строк")
 
-            connection.commit()
+            with timer.phase('commit'):
+                connection.commit()
             
             result['success'] = True
             
         except Exception as e:
             logger.error(f"[{thread_name}] Ошибка при выполнении SQL: {e}")
             result['error'] = str(e)
-            if connection:
+            result['sqlstate'] = error_sqlstate(e)
+            if connection and not connection.closed:
                 connection.rollback()
                 
         finally:
@@ -108,17 +351,632 @@ class PostgresExecutorThreads:
             if cursor:
                 cursor.close()
             if connection:
-                self.connection_pool.putconn(connection)
+                close = False
+                if autocommit and not connection.closed:
+                    try:
+                        connection.autocommit = False
+                    except psycopg2.Error:
+                        # Соединение в неизвестном состоянии (отмена запроса, разрыв) в пул не возвращается
+                        close = True
+                self._putconn(connection, close=close)
             
             result['execution_time'] = time.time() - start_time
             logger.info(f"[{thread_name}] Выполнение завершено за {result['execution_time']:.2f} сек")
         
         return result
+
+    def export_sql(self,
+                   sql_script: str,
+                   thread_name: str,
+                   file_path: str,
+                   params: Optional[Dict] = None,
+                   options: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Выгрузка результата запроса в файл через COPY (<sql>) TO STDOUT.
+        Данные пишутся в файл напрямую из протокола COPY, без создания строк Python.
+        
+        Args:
+            sql_script: SQL-запрос
+            thread_name: Имя потока (для логирования)
+            file_path: Путь к файлу выгрузки
+            params: Параметры для запроса
+            options: Параметры COPY (format, header, delimiter, null, encoding)
+            timeout: Таймаут выполнения (секунды): statement_timeout на сервере и отмена запроса
+                     клиентом, если сервер не ответил за timeout + DATABASE_TIMEOUT_GRACE
+            
+        Returns:
+            Словарь с результатами выполнения, количеством байт и пропускной способностью
+        """
+        connection = None
+        cursor = None
+        timer = PhaseTimer()
+        result = {
+            'thread_name': thread_name,
+            'success': False,
+            'execution_time': 0,
+            'rows_affected': 0,
+            'bytes_written': 0,
+            'throughput': 0.0,
+            'error': None,
+            'data': None,
+            'phases': timer.phases
+        }
+        
+        start_time = time.time()
+        
+        try:
+            connection = self._getconn(timer, timeout, thread_name)
+            cursor = connection.cursor()
+
+            logger.info(f"[{thread_name}] Начало выгрузки в {file_path}")
+
+            query = sql_script.strip().rstrip(';')
+            if params:
+                query = cursor.mogrify(query, params).decode(connection.encoding)
+            copy_sql = f"COPY ({query}) TO STDOUT {copy_options_sql(options or {'format': 'csv'})}"
+
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            # COPY TO STDOUT передает данные по мере выполнения: фазы не разделяются
+            with open(file_path, 'wb') as f, timer.phase('server_exec'):
+                cursor.copy_expert(copy_sql, f)
+
+            result['rows_affected'] = cursor.rowcount
+            result['bytes_written'] = os.path.getsize(file_path)
+            with timer.phase('commit'):
+                connection.commit()
+            result['success'] = True
+
+        except Exception as e:
+            logger.error(f"[{thread_name}] Ошибка при выгрузке: {e}")
+            result['error'] = str(e)
+            result['sqlstate'] = error_sqlstate(e)
+            if connection and not connection.closed:
+                connection.rollback()
+
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                self._putconn(connection)
+
+            result['execution_time'] = time.time() - start_time
+            result['throughput'] = throughput_mb(result['bytes_written'], result['execution_time'])
+            logger.info(
+                f"[{thread_name}] Выгружено {result['rows_affected']} строк, "
+                f"{result['bytes_written']} байт за {result['execution_time']:.2f} сек "
+                f"({result['throughput']:.2f} МБ/сек)"
+            )
+
+        return result
+
+    def load_sql(self,
+                 thread_name: str,
+                 table: str,
+                 file_pattern: str,
+                 schema: Optional[str] = None,
+                 columns: Optional[List[str]] = None,
+                 options: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Загрузка файлов в таблицу через COPY ... FROM STDIN.
+        Файлы читаются блоками по copy_chunk_size байт и целиком в память не загружаются.
+        Все файлы загружаются в одной транзакции.
+        
+        Args:
+            thread_name: Имя потока (для логирования)
+            table: Целевая таблица
+            file_pattern: Путь к файлу или glob-шаблон
+            schema: Схема целевой таблицы
+            columns: Список колонок
+            options: Параметры COPY (format, header, delimiter, null, encoding)
+            timeout: Таймаут выполнения (секунды): statement_timeout на сервере и отмена запроса
+                     клиентом, если сервер не ответил за timeout + DATABASE_TIMEOUT_GRACE
+            
+        Returns:
+            Словарь с результатами выполнения и статистикой по каждому файлу в 'files'
+        """
+        connection = None
+        cursor = None
+        timer = PhaseTimer()
+        result = {
+            'thread_name': thread_name,
+            'success': False,
+            'execution_time': 0,
+            'rows_affected': 0,
+            'bytes_written': 0,
+            'throughput': 0.0,
+            'files': [],
+            'error': None,
+            'data': None,
+            'phases': timer.phases
+        }
+        
+        start_time = time.time()
+        
+        try:
+            files = load_files(file_pattern)
+
+            connection = self._getconn(timer, timeout, thread_name)
+            cursor = connection.cursor()
+
+            target = pgsql.Identifier(schema, table) if schema else pgsql.Identifier(table)
+            column_list = pgsql.SQL('')
+            if columns:
+                column_list = pgsql.SQL(' ({})').format(pgsql.SQL(', ').join(map(pgsql.Identifier, columns)))
+            copy_sql = pgsql.SQL("COPY {}{} FROM STDIN {}").format(
+                target,
+                column_list,
+                pgsql.SQL(copy_options_sql(options or {'format': 'csv'}))
+            ).as_string(connection)
+
+            for file_path in files:
+                logger.info(f"[{thread_name}] Загрузка {file_path} в {table}")
+                file_start = time.time()
+                with open(file_path, 'rb') as f, timer.phase('server_exec'):
+                    cursor.copy_expert(copy_sql, f, size=self.copy_chunk_size)
+                stats = file_stats(
+                    file_path,
+                    max(cursor.rowcount, 0),
+                    os.path.getsize(file_path),
+                    time.time() - file_start
+                )
+                result['files'].append(stats)
+                result['rows_affected'] += stats['rows']
+                result['bytes_written'] += stats['bytes']
+                logger.info(
+                    f"[{thread_name}] {file_path}: {stats['rows']} строк, "
+                    f"{stats['rows_per_sec']:.0f} строк/сек, {stats['mb_per_sec']:.2f} МБ/сек"
+                )
+
+            with timer.phase('commit'):
+                connection.commit()
+            result['success'] = True
+
+        except Exception as e:
+            logger.error(f"[{thread_name}] Ошибка при загрузке: {e}")
+            result['error'] = str(e)
+            result['sqlstate'] = error_sqlstate(e)
+            if connection and not connection.closed:
+                connection.rollback()
+
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                self._putconn(connection)
+
+            result['execution_time'] = time.time() - start_time
+            result['throughput'] = throughput_mb(result['bytes_written'], result['execution_time'])
+            logger.info(
+                f"[{thread_name}] Загружено {result['rows_affected']} строк за "
+                f"{result['execution_time']:.2f} сек ({result['throughput']:.2f} МБ/сек)"
+            )
+
+        return result
+
+    @staticmethod
+    def _fetch_rows(cursor, fmt: str, result: Dict[str, Any], timer: PhaseTimer) -> int:
+        """Строки результата курсора в result['data'] в формате fmt; возвращает количество строк"""
+        # fetchall создает строки Python из уже полученного результата
+        with timer.phase('decode'):
+            rows = cursor.fetchall()
+            if fmt == 'columnar':
+                columns = [column.name for column in cursor.description]
+                result['data'] = ColumnarResult(columns)
+                result['data'].extend(rows)
+                result['data'].compact()
+            else:
+                result['data'] = rows
+        if fmt != 'dict':
+            result['columns'] = [column.name for column in cursor.description]
+        return len(rows)
+
+    def execute_statements(self,
+                           sql_script: str,
+                           thread_name: str,
+                           params: Optional[Any] = None,
+                           pipeline: bool = False,
+                           row_format: Optional[str] = None,
+                           timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Выполнение скрипта из нескольких выражений по отдельности (ключ split):
+        в одной транзакции на одном соединении со статистикой по каждому выражению.
+        Позиционные %s скрипта распределяются по выражениям, %(name)s получают словарь целиком.
+        
+        Args:
+            sql_script: SQL-скрипт, выражения разделены ;
+            thread_name: Имя потока (для логирования)
+            params: Параметры скрипта
+            pipeline: Подряд идущие выражения, не возвращающие строк, подставляются
+                      на клиенте (mogrify) и отправляются одним обращением к серверу
+            row_format: Формат строк в 'data' (по умолчанию формат исполнителя)
+            timeout: Таймаут выполнения (секунды): statement_timeout на сервере и отмена запроса
+                     клиентом, если сервер не ответил за timeout + DATABASE_TIMEOUT_GRACE
+            
+        Returns:
+            Словарь с результатами: 'data' - строки последнего выражения, возвращающего строки,
+            'statements' - статистика по выражениям (группам)
+        """
+        connection = None
+        cursor = None
+        timer = PhaseTimer()
+        result = {
+            'thread_name': thread_name,
+            'success': False,
+            'execution_time': 0,
+            'rows_affected': 0,
+            'statements': [],
+            'error': None,
+            'data': None,
+            'phases': timer.phases
+        }
+        
+        start_time = time.time()
+        number = 1
+        
+        try:
+            fmt = check_row_format(row_format, self.row_format)
+            statements = split_statements(sql_script, paramstyle='pyformat')
+            blocked = [statement.info.command for statement in statements if not statement.info.transactional]
+            if blocked:
+                raise ValueError(f"Выражения {', '.join(blocked)} нельзя выполнять в транзакции (split)")
+            if pipeline:
+                groups = group_statements(statements, lambda statement: not statement.info.returns_rows)
+            else:
+                groups = [[statement] for statement in statements]
+
+            connection = self._getconn(timer, timeout, thread_name)
+            cursor = connection.cursor(cursor_factory=CURSOR_FACTORIES[fmt])
+
+            logger.info(f"[{thread_name}] Начало выполнения {len(statements)} выражений ({len(groups)} обращений)")
+
+            for group in groups:
+                statement = group[0]
+                command = ', '.join(item.info.command for item in group)
+                rows_affected = None
+                statement_start = time.time()
+                with TRACER.span(command, statement=number, count=len(group)):
+                    with timer.phase('server_exec'):
+                        if len(group) > 1:
+                            # Одно обращение на группу, rowcount относится только к последнему выражению
+                            cursor.execute(';\n'.join(
+                                cursor.mogrify(item.text, item.bind(params)).decode(connection.encoding)
+                                for item in group
+                            ))
+                        else:
+                            cursor.execute(statement.text, statement.bind(params))
+                    if len(group) == 1:
+                        if cursor.description is not None:
+                            rows_affected = self._fetch_rows(cursor, fmt, result, timer)
+                        else:
+                            rows_affected = max(cursor.rowcount, 0)
+                result['statements'].append({
+                    'statement': number,
+                    'count': len(group),
+                    'command': command,
+                    'rows': rows_affected,
+                    'execution_time': time.time() - statement_start
+                })
+                result['rows_affected'] += rows_affected or 0
+                number += len(group)
+
+            with timer.phase('commit'):
+                connection.commit()
+
+            result['success'] = True
+
+        except Exception as e:
+            logger.error(f"[{thread_name}] Ошибка при выполнении выражения {number}: {e}")
+            result['error'] = f"Выражение {number}: {e}"
+            result['sqlstate'] = error_sqlstate(e)
+            if connection and not connection.closed:
+                connection.rollback()
+
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                self._putconn(connection)
+
+            result['execution_time'] = time.time() - start_time
+            logger.info(
+                f"[{thread_name}] Выполнено {len(result['statements'])} обращений, "
+                f"обработано {result['rows_affected']} строк за {result['execution_time']:.2f} сек"
+            )
+
+        return result
+
+    def execute_bulk(self,
+                     sql_script: str,
+                     thread_name: str,
+                     params_batch: Iterable[Sequence[Any]],
+                     mode: str = 'batch',
+                     page_size: Optional[int] = None,
+                     template: Optional[str] = None,
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Пакетное выполнение DML для множества наборов параметров.
+        Наборы параметров отправляются страницами по page_size, каждая страница
+        фиксируется отдельной транзакцией.
+        
+        Args:
+            sql_script: Шаблон запроса. Для mode='values' - запрос с одним %s вместо VALUES
+            thread_name: Имя потока (для логирования)
+            params_batch: Наборы параметров (читаются лениво)
+            mode: 'values' - psycopg2.extras.execute_values (один INSERT ... VALUES на страницу),
+                  'batch' - psycopg2.extras.execute_batch (страница запросов за одно обращение)
+            page_size: Размер страницы наборов параметров
+            template: Шаблон строки для execute_values, например '(%s, %s::jsonb)'
+            timeout: Таймаут выполнения (секунды): statement_timeout на сервере и отмена запроса
+                     клиентом, если сервер не ответил за timeout + DATABASE_TIMEOUT_GRACE
+            
+        Returns:
+            Словарь с результатами выполнения и статистикой по страницам в 'chunks'
+        """
+        connection = None
+        cursor = None
+        timer = PhaseTimer()
+        result = {
+            'thread_name': thread_name,
+            'success': False,
+            'execution_time': 0,
+            'rows_affected': 0,
+            'chunks': [],
+            'error': None,
+            'data': None,
+            'phases': timer.phases
+        }
+        
+        start_time = time.time()
+        
+        try:
+            if mode not in ('values', 'batch'):
+                raise ValueError(f"Неподдерживаемый режим bulk: {mode}. Допустимые: values, batch")
+
+            connection = self._getconn(timer, timeout, thread_name)
+            cursor = connection.cursor()
+
+            logger.info(f"[{thread_name}] Начало пакетного выполнения SQL ({mode})")
+
+            for number, page in enumerate(batched(params_batch, page_size or self.page_size), 1):
+                page_start = time.time()
+                with timer.phase('server_exec'):
+                    if mode == 'values':
+                        psycopg2.extras.execute_values(cursor, sql_script, page, template=template, page_size=len(page))
+                        rows = cursor.rowcount if cursor.rowcount >= 0 else len(page)
+                    else:
+                        # execute_batch объединяет запросы страницы, rowcount относится только к последнему
+                        psycopg2.extras.execute_batch(cursor, sql_script, page, page_size=len(page))
+                        rows = len(page)
+                with timer.phase('commit'):
+                    connection.commit()
+                result['chunks'].append({
+                    'chunk': number,
+                    'rows': rows,
+                    'execution_time': time.time() - page_start
+                })
+                result['rows_affected'] += rows
+
+            result['success'] = True
+
+        except Exception as e:
+            failed_page = len(result['chunks']) + 1
+            logger.error(f"[{thread_name}] Ошибка при выполнении страницы {failed_page}: {e}")
+            result['error'] = f"Страница {failed_page}: {e}"
+            result['sqlstate'] = error_sqlstate(e)
+            if connection and not connection.closed:
+                connection.rollback()
+
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                self._putconn(connection)
+
+            result['execution_time'] = time.time() - start_time
+            logger.info(
+                f"[{thread_name}] Обработано {result['rows_affected']} строк "
+                f"в {len(result['chunks'])} страницах за {result['execution_time']:.2f} сек"
+            )
+
+        return result
+
+    def execute_to_sink(self,
+                        sql_script: str,
+                        thread_name: str,
+                        sink_config: Dict[str, Any],
+                        params: Optional[Dict] = None,
+                        itersize: Optional[int] = None,
+                        timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Потоковое выполнение запроса с записью результата в приемник (секция sink)"""
+        try:
+            sink = create_sink(sink_config, thread_name)
+        except (ValueError, RuntimeError) as e:
+            logger.error(f"[{thread_name}] Ошибка настройки sink: {e}")
+            return {'thread_name': thread_name, 'success': False, 'execution_time': 0,
+                    'rows_affected': 0, 'error': str(e), 'data': None}
+        try:
+            result = self.execute_sql(
+                sql_script,
+                thread_name,
+                params=params,
+                fetch='stream',
+                itersize=itersize,
+                sink=sink.write,
+                timeout=timeout
+            )
+        finally:
+            sink.close()
+        result['files'] = sink.files
+        result['bytes_written'] = sink.bytes_written
+        result['throughput'] = throughput_mb(sink.bytes_written, result['execution_time'])
+        return result
+
+    def execute_script(self, key: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполнение скрипта из scripts.yml в зависимости от его типа"""
+        metrics.QUERIES_IN_FLIGHT.inc(executor='threads')
+        try:
+            with TRACER.span(item.get('name', key), new_track=True, key=key) as span:
+                result = self._run_script(key, item)
+                if span:
+                    span.set(success=result['success'], rows=result['rows_affected'],
+                             bytes=result.get('bytes_written', 0), error=result.get('error'))
+        finally:
+            metrics.QUERIES_IN_FLIGHT.dec(executor='threads')
+        metrics.observe_script(result['thread_name'], result['success'], result.get('skipped', False),
+                               result['execution_time'], result['rows_affected'])
+        return result
+
+    def _run_script(self, key: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        name = item.get('name', key)
+        script_type = item.get('type')
+        if script_type in ('export', 'load'):
+            try:
+                options = copy_options(item)
+            except ValueError as e:
+                return {'thread_name': name, 'success': False, 'execution_time': 0,
+                        'rows_affected': 0, 'error': str(e), 'data': None}
+        if script_type == 'load':
+            return self.load_sql(
+                name,
+                table=item.get('table', ''),
+                file_pattern=item.get('file', ''),
+                schema=item.get('schema'),
+                columns=item.get('columns'),
+                options=options,
+                timeout=item.get('timeout')
+            )
+        if item.get('sink'):
+            return self.execute_to_sink(
+                item.get('sql', ''),
+                name,
+                item['sink'],
+                params=item.get('params'),
+                itersize=item.get('itersize') or item.get('chunk_size'),
+                timeout=item.get('timeout')
+            )
+        if item.get('params_batch') is not None:
+            try:
+                params_batch = iter_params(item)
+            except ValueError as e:
+                return {'thread_name': name, 'success': False, 'execution_time': 0,
+                        'rows_affected': 0, 'error': str(e), 'data': None}
+            return self.execute_bulk(
+                item.get('sql', ''),
+                name,
+                params_batch,
+                mode=item.get('bulk') or 'batch',
+                page_size=item.get('page_size') or item.get('batch_size'),
+                template=item.get('template'),
+                timeout=item.get('timeout')
+            )
+        if item.get('split'):
+            try:
+                pipeline = split_mode(item['split']) == 'pipeline'
+            except ValueError as e:
+                return {'thread_name': name, 'success': False, 'execution_time': 0,
+                        'rows_affected': 0, 'error': str(e), 'data': None}
+            return self.execute_statements(
+                item.get('sql', ''),
+                name,
+                params=item.get('params'),
+                pipeline=pipeline,
+                row_format=item.get('row_format'),
+                timeout=item.get('timeout')
+            )
+        if script_type == 'export':
+            return self.export_sql(
+                item.get('sql', ''),
+                name,
+                file_path=item.get('file', ''),
+                params=item.get('params'),
+                options=options,
+                timeout=item.get('timeout')
+            )
+        return self.execute_sql(
+            item.get('sql', ''),
+            name,
+            fetch=item.get('fetch'),
+            itersize=item.get('itersize') or item.get('chunk_size'),
+            row_format=item.get('row_format'),
+            spill_threshold=item.get('spill_threshold'),
+            timeout=item.get('timeout')
+        )
+
+    def _stream_rows(self,
+                     connection,
+                     sql_script: str,
+                     params: Optional[Dict],
+                     itersize: int,
+                     timer: Optional[PhaseTimer] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Чтение результата именованным (серверным) курсором порциями по itersize строк.
+        Управление транзакцией и возврат соединения в пул остаются за вызывающим кодом.
+        """
+        timer = timer or PhaseTimer()
+        cursor = connection.cursor(
+            name=f"stream_{uuid.uuid4().hex}",
+            cursor_factory=psycopg2.extras.RealDictCursor
+        )
+        try:
+            cursor.itersize = itersize
+            with timer.phase('server_exec'):
+                if params:
+                    cursor.execute(sql_script, params)
+                else:
+                    cursor.execute(sql_script)
+            while True:
+                with timer.phase('fetch_transfer'):
+                    rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def iterate_sql(self,
+                    sql_script: str,
+                    thread_name: str,
+                    params: Optional[Dict] = None,
+                    itersize: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Потоковое выполнение SELECT-запроса в виде итератора порций строк
+
+        Использование:
+            for rows in executor.iterate_sql("SELECT * FROM table", "report"):
+                process(rows)
+
+        Соединение занимается на все время итерации и возвращается в пул
+        после ее завершения или прерывания.
+        """
+        connection = self._getconn()
+        completed = False
+        try:
+            logger.info(f"[{thread_name}] Начало потокового чтения")
+            yield from self._stream_rows(connection, sql_script, params, itersize or self.stream_itersize)
+            completed = True
+        finally:
+            if completed:
+                connection.commit()
+            else:
+                connection.rollback()
+            self._putconn(connection)
     
     def execute_in_threads( self, 
-                            sql_scripts: dict[str, dict[str, str]]) ->  List[Dict[str, Any]]:
+                            sql_scripts: dict[str, dict[str, str]],
+                            max_workers: Optional[int] = None,
+                            durations: Optional[Dict[str, float]] = None) ->  List[Dict[str, Any]]:
         """
-        Параллельное выполнение нескольких SQL-скриптов
+        Параллельное выполнение нескольких SQL-скриптов фиксированным набором
+        рабочих потоков (по умолчанию по размеру пула соединений), которые
+        разбирают готовые к запуску скрипты с учетом зависимостей (depends_on).
+        Скрипты, зависящие от завершившихся с ошибкой, пропускаются.
+        После временной ошибки (политика retry) скрипт возвращается в очередь готовых
+        по таймеру, рабочий поток на время задержки не занимается.
         
         Args:
             -| sql_scripts: Список объектов SQL-скриптов
@@ -127,27 +985,81 @@ class PostgresExecutorThreads:
             --------|- SELECT 1 as VALUE
             -----| name: "Проверка подключения"
             -----| type: SELECT
+            max_workers: Количество рабочих потоков (не больше размера пула)
+            durations: Ожидаемая длительность скриптов (первыми запускаются самые долгие)
             
         Returns:
-            Список результатов выполнения каждого потока
+            Список результатов выполнения каждого скрипта
         """
 
         threads = []
-        results = []
-        
-        def thread_wrapper(sql: str, name: str, result_list: list):
-            """Обертка для потока"""
-            result = self.execute_sql(sql, name)
-            result_list.append(result)
+        results: Dict[str, Dict[str, Any]] = {}
+        graph = ScriptGraph(sql_scripts, durations)
+        condition = threading.Condition()
+        attempts: Dict[str, int] = {}
+        default = default_policy()
+
+        def requeue(key: str) -> None:
+            with condition:
+                graph.requeue(key)
+                condition.notify_all()
+
+        def worker():
+            """Рабочий поток: выполняет готовые скрипты, пока все не будут завершены"""
+            current = threading.current_thread()
+            worker_name = current.name
+            while True:
+                with condition:
+                    while not graph.has_ready() and not graph.finished():
+                        condition.wait()
+                    if not graph.has_ready():
+                        return
+                    key = graph.pop_ready()
+                    attempts[key] = attempts.get(key, 0) + 1
+                item = sql_scripts[key]
+                # Имя потока попадает в лог, поэтому на время выполнения используем имя скрипта
+                current.name = item.get('name', key)
+                try:
+                    result = self.execute_script(key, item)
+                except Exception as e:
+                    logger.error(f"[{current.name}] Ошибка при выполнении скрипта: {e}")
+                    result = {'thread_name': current.name, 'success': False, 'execution_time': 0,
+                              'rows_affected': 0, 'error': str(e), 'data': None}
+                finally:
+                    current.name = worker_name
+                result['attempts'] = attempts[key]
+
+                # Страницы params_batch фиксируются по отдельности: повтор продублировал бы уже записанные
+                if not result['success'] and not result.get('chunks'):
+                    delay = next_delay(item, result['thread_name'], attempts[key], result.get('sqlstate'), default)
+                    if delay is not None:
+                        timer = threading.Timer(delay, requeue, (key,))
+                        timer.daemon = True
+                        timer.start()
+                        continue
+                with condition:
+                    results[key] = result
+                    for skipped_key, failed_key in graph.complete(key, result['success']):
+                        skipped_name = sql_scripts[skipped_key].get('name', skipped_key)
+                        logger.warning(f"[{skipped_name}] Пропущен: не выполнена зависимость '{failed_key}'")
+                        results[skipped_key] = {
+                            'thread_name': skipped_name,
+                            'success': False,
+                            'skipped': True,
+                            'execution_time': 0,
+                            'rows_affected': 0,
+                            'error': f"Пропущен: не выполнена зависимость '{failed_key}'",
+                            'data': None
+                        }
+                        metrics.observe_script(skipped_name, False, True, 0, 0)
+                    condition.notify_all()
+
+        workers_count = min(max_workers or self.max_connections, self.max_connections, len(sql_scripts))
         
         # # Создаем и запускаем потоки
-        logger.info(f"Запуск {len(sql_scripts)} потоков...")
-        for i, (key, item) in enumerate(sql_scripts.items()):
-            thread = threading.Thread(
-                target=thread_wrapper,
-                args=(item.get('sql',''), item.get('name',key), results),
-                name=item.get('name',key)
-            )
+        logger.info(f"Запуск {len(sql_scripts)} скриптов в {workers_count} потоках...")
+        for i in range(workers_count):
+            thread = threading.Thread(target=worker, name=f"worker-{i + 1}")
             threads.append(thread)
             thread.start()
 
@@ -156,12 +1068,14 @@ class PostgresExecutorThreads:
             thread.join()
         
         logger.info("Все потоки завершены")
-        return results
+        return [results[key] for key in sql_scripts if key in results]
     
     def close(self):
         """Закрытие пула соединений"""
         if hasattr(self, 'connection_pool'):
             self.connection_pool.closeall()
+            with self._pool_lock:
+                self._conns_in_use = self._conns_idle = 0
             logger.info("Пул соединений закрыт")
 
 class PostgresRunThreads:
@@ -202,10 +1116,27 @@ class PostgresRunThreads:
             logger.info("Начало параллельного выполнения SQL-скриптов")
             logger.info("=" * 50)
             
+            metrics.start_http_server(settings.METRICS_PORT)
+            TRACER.start(settings.TRACE_FILE)
+            
             executor = PostgresExecutorThreads(**settings.DATABASE_PARAMS)
             
-            # Выполняем SQL в трех потоках
-            results = executor.execute_in_threads(scripts.scripts)
+            # Порядок запуска определяется историей длительности выполнения
+            history = ExecutionHistory()
+
+            # Выполняем SQL в потоках
+            with TRACER.span('PostgresRunThreads.run', scripts=len(scripts.scripts)) as span:
+                results = executor.execute_in_threads(
+                    scripts.scripts,
+                    durations=history.durations(scripts.scripts)
+                )
+                if span:
+                    span.set(success=sum(1 for result in results if result['success']))
+
+            for result in results:
+                if result['success']:
+                    history.record(result['thread_name'], result['execution_time'])
+            history.save()
             
             # # Выводим результаты
             logger.info("")
@@ -215,12 +1146,22 @@ class PostgresRunThreads:
             
             success_count = 0
             for result in results:
-                status = "УСПЕХ" if result['success'] else "ОШИБКА"
+                status = "УСПЕХ" if result['success'] else ("ПРОПУЩЕН" if result.get('skipped') else "ОШИБКА")
                 logger.info("")
                 logger.info(f"Поток: {result['thread_name']}")
                 logger.info(f"Статус: {status}")
                 logger.info(f"Время выполнения: {result['execution_time']:.2f} сек")
                 logger.info(f"Строк обработано: {result['rows_affected']}")
+                if result.get('attempts', 1) > 1:
+                    logger.info(f"Попыток: {result['attempts']}")
+                if result.get('bytes_written'):
+                    logger.info(f"Записано: {result['bytes_written']} байт ({result['throughput']:.2f} МБ/сек)")
+                if result.get('phases'):
+                    logger.info(f"Фазы (сек): {PhaseTimer.format(result['phases'])}")
+                for entry in result.get('statements') or []:
+                    rows = '-' if entry['rows'] is None else entry['rows']
+                    logger.info(f"  Выражение {entry['statement']} ({entry['command']}): "
+                                f"строк {rows}, {entry['execution_time']:.3f} сек")
                 
                 if result['success']:
                     success_count += 1
@@ -236,6 +1177,8 @@ class PostgresRunThreads:
             logger.error(f"Критическая ошибка: {e}")
             
         finally:
+            metrics.write_textfile(settings.METRICS_TEXTFILE)
+            TRACER.write()
             # Закрываем соединения
             if executor:
                 executor.close()
@@ -0,0 +1,243 @@
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import os
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Mapping, Optional, Sequence
+
+
+# Сжатие текстовых форматов средствами стандартной библиотеки
+COMPRESSIONS = {
+    'gzip': ('.gz', lambda raw: gzip.GzipFile(fileobj=raw, mode='wb')),
+    'bz2': ('.bz2', lambda raw: bz2.BZ2File(raw, mode='wb')),
+    'xz': ('.xz', lambda raw: lzma.LZMAFile(raw, mode='wb')),
+}
+
+
+class ResultSink:
+    """
+    Приемник результатов запроса: строки записываются в файл порциями по мере получения.
+
+    Поддерживается ротация файлов по размеру (max_bytes) и количеству строк (max_rows):
+    report.csv -> report.00001.csv, report.00002.csv, ...
+    """
+    extension = ''
+
+    def __init__(self,
+                 path: str,
+                 compression: Optional[str] = None,
+                 max_bytes: Optional[int] = None,
+                 max_rows: Optional[int] = None):
+        self.path = path
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.files: List[Dict[str, Any]] = []
+        self.columns: Optional[List[str]] = None
+        self._raw: Optional[BinaryIO] = None
+        self._file_rows = 0
+
+    @property
+    def rows_written(self) -> int:
+        return sum(item['rows'] for item in self.files)
+
+    @property
+    def bytes_written(self) -> int:
+        return sum(item['bytes'] for item in self.files)
+
+    def _file_path(self) -> str:
+        """Путь к очередному файлу с учетом ротации"""
+        if not (self.max_bytes or self.max_rows):
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        return f"{base}.{len(self.files) + 1:05d}{ext}"
+
+    def _open(self) -> None:
+        path = self._file_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._raw = open(path, 'wb')
+        self._file_rows = 0
+        self.files.append({'file': path, 'rows': 0, 'bytes': 0})
+        self._open_writer(self._raw)
+
+    def _rotate_due(self) -> bool:
+        if self.max_rows and self._file_rows >= self.max_rows:
+            return True
+        return bool(self.max_bytes and self._raw.tell() >= self.max_bytes)
+
+    def write(self, rows: Sequence[Mapping[str, Any]]) -> None:
+        """Запись порции строк (dict, RealDictRow или asyncpg.Record)"""
+        if not rows:
+            return
+        if self.columns is None:
+            self.columns = list(rows[0].keys())
+        start = 0
+        while start < len(rows):
+            if self._raw is None:
+                self._open()
+            count = len(rows) - start
+            if self.max_rows:
+                count = min(count, self.max_rows - self._file_rows)
+            self._write_rows(rows[start:start + count])
+            self._file_rows += count
+            self.files[-1]['rows'] += count
+            start += count
+            if self._rotate_due():
+                self._close_file()
+
+    def close(self) -> None:
+        """Завершение записи"""
+        if self._raw is not None:
+            self._close_file()
+
+    def _close_file(self) -> None:
+        self._close_writer()
+        self._raw.close()
+        self.files[-1]['bytes'] = os.path.getsize(self.files[-1]['file'])
+        self._raw = None
+
+    def _open_writer(self, raw: BinaryIO) -> None:
+        raise NotImplementedError
+
+    def _write_rows(self, rows: Sequence[Mapping[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def _close_writer(self) -> None:
+        raise NotImplementedError
+
+
+class _TextSink(ResultSink):
+    """Основа текстовых приемников с необязательным сжатием"""
+
+    def __init__(self, path: str, compression: Optional[str] = None, **kwargs):
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(f"Неподдерживаемое сжатие: {compression}. Допустимые: {', '.join(COMPRESSIONS)}")
+        if compression and not path.endswith(COMPRESSIONS[compression][0]):
+            path += COMPRESSIONS[compression][0]
+        super().__init__(path, compression=compression, **kwargs)
+        self._stream: Optional[BinaryIO] = None
+        self._text: Optional[io.TextIOWrapper] = None
+
+    def _file_path(self) -> str:
+        path = super()._file_path()
+        if self.compression and (self.max_bytes or self.max_rows):
+            # report.csv.gz -> report.00001.csv.gz, а не report.csv.00001.gz
+            suffix = COMPRESSIONS[self.compression][0]
+            base = self.path[:-len(suffix)]
+            stem, ext = os.path.splitext(base)
+            path = f"{stem}.{len(self.files) + 1:05d}{ext}{suffix}"
+        return path
+
+    def _open_writer(self, raw: BinaryIO) -> None:
+        self._stream = COMPRESSIONS[self.compression][1](raw) if self.compression else raw
+        self._text = io.TextIOWrapper(self._stream, encoding='utf-8', newline='', write_through=False)
+
+    def _close_writer(self) -> None:
+        self._text.flush()
+        self._text.detach()
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._text = None
+        self._stream = None
+
+
+class CsvSink(_TextSink):
+    """Запись в CSV с заголовком в каждом файле"""
+    extension = '.csv'
+
+    def _open_writer(self, raw: BinaryIO) -> None:
+        super()._open_writer(raw)
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(self.columns)
+
+    def _write_rows(self, rows: Sequence[Mapping[str, Any]]) -> None:
+        self._writer.writerows([row[column] for column in self.columns] for row in rows)
+        self._text.flush()
+
+
+class JsonlSink(_TextSink):
+    """Запись в JSON Lines: одна строка результата - один JSON-объект"""
+    extension = '.jsonl'
+
+    def _write_rows(self, rows: Sequence[Mapping[str, Any]]) -> None:
+        self._text.writelines(
+            json.dumps({column: row[column] for column in self.columns}, ensure_ascii=False, default=str) + '\n'
+            for row in rows
+        )
+        self._text.flush()
+
+
+class ParquetSink(ResultSink):
+    """Запись в Parquet (требуется pyarrow), каждая порция - отдельная группа строк"""
+    extension = '.parquet'
+
+    def __init__(self, path: str, compression: Optional[str] = None, **kwargs):
+        # pyarrow импортируется только при записи в parquet: импорт занимает заметное время
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Для формата parquet требуется установить pyarrow") from None
+        self._pyarrow = pyarrow
+        super().__init__(path, compression=compression or 'snappy', **kwargs)
+        self._writer = None
+
+    def _open_writer(self, raw: BinaryIO) -> None:
+        self._writer = None
+
+    def _write_rows(self, rows: Sequence[Mapping[str, Any]]) -> None:
+        table = self._pyarrow.Table.from_pylist([{column: row[column] for column in self.columns} for row in rows])
+        if self._writer is None:
+            self._writer = self._pyarrow.parquet.ParquetWriter(self._raw, table.schema, compression=self.compression)
+        self._writer.write_table(table)
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+SINKS = {
+    'csv': CsvSink,
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+
+
+def create_sink(config: Dict[str, Any], query_name: str = '') -> ResultSink:
+    """
+    Создание приемника по секции sink из scripts.yml
+
+    Ключи:
+        path: Путь к файлу, допускаются подстановки {name} и {timestamp}
+        format: csv, jsonl или parquet (по умолчанию по расширению файла)
+        compression: gzip, bz2, xz или по расширению файла (для parquet - кодек pyarrow: snappy, zstd, ...)
+        max_bytes: Ротация файла по размеру (байты)
+        max_rows: Ротация файла по количеству строк
+    """
+    if not config.get('path'):
+        raise ValueError("В секции sink не указан path")
+    path = config['path'].format(
+        name=query_name,
+        timestamp=datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    )
+    compression = config.get('compression')
+    base = path
+    for name, (suffix, _) in COMPRESSIONS.items():
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+            compression = compression or name
+    fmt = (config.get('format') or os.path.splitext(base)[1].lstrip('.') or 'csv').lower()
+    if fmt not in SINKS:
+        raise ValueError(f"Неподдерживаемый формат sink: {fmt}. Допустимые: {', '.join(SINKS)}")
+    return SINKS[fmt](
+        path,
+        compression=compression,
+        max_bytes=config.get('max_bytes'),
+        max_rows=config.get('max_rows')
+    )
@@ -0,0 +1,119 @@
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from src.databaseSettings import settings
+from src.logger import logger
+from src import metrics
+
+# Временные ошибки PostgreSQL по умолчанию: serialization_failure, deadlock_detected,
+# too_many_connections, admin_shutdown, cannot_connect_now и весь класс 08 (ошибки соединения).
+# Код из двух символов означает весь класс SQLSTATE
+DEFAULT_SQLSTATES = ('40001', '40P01', '53300', '57P01', '57P03', '08')
+# SQLSTATE для разорванного соединения, если драйвер не сообщил код (connection_failure)
+CONNECTION_FAILURE = '08006'
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Политика повторного запуска скрипта после временной ошибки.
+
+    Задержка перед повтором - экспоненциальная с полным джиттером:
+    случайное значение от 0 до min(max_delay, base_delay * 2 ** (попытка - 1)).
+    """
+    attempts: int = 1  # Общее количество попыток (1 - без повторов)
+    base_delay: float = 0.5  # Базовая задержка (секунды)
+    max_delay: float = 30.0  # Максимальная задержка (секунды)
+    sqlstates: Tuple[str, ...] = DEFAULT_SQLSTATES  # Коды SQLSTATE (или классы из двух символов) для повтора
+
+    def retryable(self, sqlstate: Optional[str]) -> bool:
+        """Относится ли ошибка к повторяемым"""
+        if not sqlstate:
+            return False
+        return any(sqlstate.startswith(code) if len(code) == 2 else sqlstate == code for code in self.sqlstates)
+
+    def should_retry(self, attempt: int, sqlstate: Optional[str]) -> bool:
+        """Нужен ли повтор после неудачной попытки attempt (нумерация с 1)"""
+        return attempt < self.attempts and self.retryable(sqlstate)
+
+    def delay(self, attempt: int) -> float:
+        """Задержка перед следующей попыткой после неудачной попытки attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def default_policy() -> RetryPolicy:
+    """Глобальная политика из настроек RETRY_*"""
+    sqlstates = tuple(code.strip().upper() for code in settings.RETRY_SQLSTATES.split(',') if code.strip())
+    return RetryPolicy(
+        attempts=max(settings.RETRY_ATTEMPTS, 1),
+        base_delay=settings.RETRY_BASE_DELAY,
+        max_delay=settings.RETRY_MAX_DELAY,
+        sqlstates=sqlstates or DEFAULT_SQLSTATES
+    )
+
+
+def retry_policy(item: Dict[str, Any], default: Optional[RetryPolicy] = None) -> RetryPolicy:
+    """
+    Политика скрипта: ключ retry поверх глобальной политики.
+    retry: 3 - количество попыток; retry: {attempts, base_delay, max_delay, sqlstates} - отдельные параметры
+    """
+    policy = default or default_policy()
+    retry = item.get('retry')
+    if retry is None:
+        return policy
+    if isinstance(retry, bool) or not isinstance(retry, (int, dict)):
+        raise ValueError(f"Ключ retry должен быть числом попыток или словарем, получено: {retry!r}")
+    if isinstance(retry, int):
+        retry = {'attempts': retry}
+    unknown = set(retry) - {'attempts', 'base_delay', 'max_delay', 'sqlstates'}
+    if unknown:
+        raise ValueError(f"Неизвестные параметры retry: {', '.join(sorted(unknown))}")
+    sqlstates = retry.get('sqlstates', policy.sqlstates)
+    if isinstance(sqlstates, str):
+        sqlstates = [sqlstates]
+    return RetryPolicy(
+        attempts=max(int(retry.get('attempts', policy.attempts)), 1),
+        base_delay=float(retry.get('base_delay', policy.base_delay)),
+        max_delay=float(retry.get('max_delay', policy.max_delay)),
+        sqlstates=tuple(str(code).upper() for code in sqlstates)
+    )
+
+
+def next_delay(item: Dict[str, Any], name: str, attempt: int, sqlstate: Optional[str],
+               default: Optional[RetryPolicy] = None) -> Optional[float]:
+    """Задержка перед повтором скрипта после неудачной попытки attempt или None, если повтор не нужен"""
+    try:
+        policy = retry_policy(item, default)
+    except ValueError as e:
+        logger.error(f"[{name}] {e}")
+        return None
+    if not policy.should_retry(attempt, sqlstate):
+        return None
+    delay = policy.delay(attempt)
+    logger.warning(f"[{name}] Временная ошибка {sqlstate}, попытка {attempt} из {policy.attempts}, "
+                   f"повтор через {delay:.2f} сек")
+    metrics.QUERY_RETRIES.inc(script=name, sqlstate=sqlstate)
+    return delay
+
+
+def error_sqlstate(error: BaseException) -> Optional[str]:
+    """
+    SQLSTATE ошибки: sqlstate (asyncpg) или pgcode (psycopg2).
+    Ошибки сокета (ConnectionError) и OperationalError psycopg2 без кода считаются разрывом соединения
+    """
+    code = getattr(error, 'sqlstate', None) or getattr(error, 'pgcode', None)
+    if code:
+        return code
+    if isinstance(error, ConnectionError) or _operational_error(error):
+        return CONNECTION_FAILURE
+    return None
+
+
+def _operational_error(error: BaseException) -> bool:
+    """Ошибка psycopg2.OperationalError (и подклассы); драйвер импортируется только при проверке"""
+    try:
+        import psycopg2
+    except ImportError:
+        return False
+    return isinstance(error, psycopg2.OperationalError)
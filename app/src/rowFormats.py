@@ -0,0 +1,100 @@
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# dict     - список словарей (по умолчанию)
+# tuple    - список кортежей, имена колонок в QueryResult.columns
+# record   - строки драйвера как есть (asyncpg.Record / namedtuple для psycopg2)
+# columnar - ColumnarResult: по одному списку (array.array для чисел) на колонку
+ROW_FORMATS = ('dict', 'tuple', 'record', 'columnar')
+
+
+def row_format(value: Optional[str], default: str = 'dict') -> str:
+    """Проверка формата строк из scripts.yml или настроек"""
+    fmt = (value or default).lower()
+    if fmt not in ROW_FORMATS:
+        raise ValueError(f"Неподдерживаемый row_format: {value}. Допустимые: {', '.join(ROW_FORMATS)}")
+    return fmt
+
+
+class ColumnarResult:
+    """
+    Колоночное представление результата: один кортеж имен колонок и
+    по одному списку значений на колонку, без словаря на каждую строку.
+    Целочисленные и вещественные колонки без NULL хранятся в array.array.
+    """
+    __slots__ = ('columns', 'values')
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self.values: List[Any] = [[] for _ in self.columns]
+
+    def extend(self, rows: Sequence[Sequence[Any]]) -> None:
+        """Добавление порции строк (кортежи или asyncpg.Record)"""
+        if not rows:
+            return
+        for i, values in enumerate(zip(*rows)):
+            self.values[i].extend(values)
+
+    def compact(self) -> 'ColumnarResult':
+        """Перевод однотипных числовых колонок в array.array"""
+        for i, values in enumerate(self.values):
+            if not isinstance(values, list) or not values:
+                continue
+            kinds = {type(value) for value in values}
+            try:
+                if kinds == {int}:
+                    self.values[i] = array('q', values)
+                elif kinds <= {int, float} and float in kinds:
+                    self.values[i] = array('d', values)
+            except OverflowError:
+                pass
+        return self
+
+    def column(self, name: str) -> Sequence[Any]:
+        """Значения колонки по имени"""
+        return self.values[self.columns.index(name)]
+
+    def rows(self) -> Iterator[Tuple[Any, ...]]:
+        """Построчный обход (кортежи)"""
+        return zip(*self.values)
+
+    def __len__(self) -> int:
+        return len(self.values[0]) if self.values else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Сериализуемое представление"""
+        return {'columns': list(self.columns), 'values': {
+            column: list(values) for column, values in zip(self.columns, self.values)
+        }}
+
+
+def convert_rows(rows: Sequence[Any], fmt: str, columns: Optional[Sequence[str]] = None) -> Any:
+    """
+    Преобразование строк драйвера в заданный формат.
+    Для asyncpg.Record имена колонок берутся из первой строки,
+    для кортежей и пустого результата передаются в columns.
+    """
+    if fmt == 'record':
+        return rows
+    if fmt == 'tuple':
+        return [tuple(row) for row in rows]
+    if fmt == 'columnar':
+        if columns is None:
+            columns = list(rows[0].keys()) if rows else []
+        result = ColumnarResult(columns)
+        result.extend(rows)
+        return result.compact()
+    if columns is not None and rows and isinstance(rows[0], tuple):
+        return [dict(zip(columns, row)) for row in rows]
+    return [dict(row) for row in rows]
+
+
+def portable_data(data: Any) -> Any:
+    """Данные результата, пригодные для передачи между процессами (asyncpg.Record -> tuple)"""
+    if hasattr(data, 'owner'):
+        # SpilledRows передается путем к файлу, файлом теперь владеет получатель
+        data.owner = False
+        return data
+    if isinstance(data, list) and data and type(data[0]).__module__.startswith('asyncpg'):
+        return [tuple(row) for row in data]
+    return data
@@ -0,0 +1,398 @@
+import asyncio
+import re
+import signal
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from src.logger import logger
+from src.databaseSettings import settings
+from src.parseScripts import ParseScripts, ScriptsDiff, scripts
+from src.executionHistory import ExecutionHistory
+from src.postgresExecutorAsync import PostgresExecutorAsync, QueryResult
+from src.retryPolicy import default_policy
+from src import metrics
+
+# Псевдонимы cron-выражений
+CRON_ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# Поля cron: минута, час, день месяца, месяц, день недели (0 и 7 - воскресенье)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+INTERVAL_PATTERN = re.compile(r'^(?:every\s+)?(\d+(?:\.\d+)?)\s*([smhd]?)$')
+
+
+class IntervalSchedule:
+    """Запуск с фиксированным интервалом; первый запуск - сразу после старта"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError(f"Интервал расписания должен быть больше нуля: {seconds}")
+        self.interval = timedelta(seconds=seconds)
+
+    def first_run(self, now: datetime) -> datetime:
+        return now
+
+    def next_run(self, previous: datetime, now: datetime) -> datetime:
+        # Отсчет от запланированного времени, а не от завершения: без накопления сдвига.
+        # Пропущенные (из-за долгого выполнения) запуски не догоняются
+        run_at = previous + self.interval
+        if run_at <= now:
+            missed = (now - run_at) // self.interval + 1
+            run_at += self.interval * missed
+        return run_at
+
+    def __str__(self) -> str:
+        return f"каждые {self.interval.total_seconds():g} сек"
+
+
+class CronSchedule:
+    """Расписание в формате cron из пяти полей (*, */n, a-b, a-b/n, списки через запятую)"""
+
+    def __init__(self, expression: str):
+        self.expression = CRON_ALIASES.get(expression.strip(), expression.strip())
+        parts = self.expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron-выражение должно содержать 5 полей: '{expression}'")
+        minutes, hours, days, months, weekdays = (
+            self._field(part, low, high) for part, (low, high) in zip(parts, CRON_FIELDS)
+        )
+        self.minutes, self.hours, self.days, self.months = minutes, hours, days, months
+        self.weekdays = {0 if day == 7 else day for day in weekdays}
+        # Как в cron: если заданы и день месяца, и день недели, достаточно совпадения одного из них
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _field(expression: str, low: int, high: int) -> Set[int]:
+        values: Set[int] = set()
+        for part in expression.split(','):
+            step = 1
+            if '/' in part:
+                part, step_value = part.split('/', 1)
+                step = int(step_value)
+                if step < 1:
+                    raise ValueError(f"Некорректный шаг cron: '{expression}'")
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Значение cron вне диапазона {low}-{high}: '{expression}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def first_run(self, now: datetime) -> datetime:
+        return self.next_run(now, now)
+
+    def next_run(self, previous: datetime, now: datetime) -> datetime:
+        moment = max(previous, now).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Не больше нескольких лет перебора: для выражений вроде "0 0 30 2 *" совпадений нет
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron-выражение '{self.expression}' не имеет ближайших запусков")
+
+    def __str__(self) -> str:
+        return f"cron '{self.expression}'"
+
+
+def parse_schedule(value: Any):
+    """
+    Разбор ключа schedule скрипта:
+        schedule: 60            - интервал в секундах
+        schedule: "5m"          - интервал (s, m, h, d), допускается "every 5m"
+        schedule: "*/5 * * * *" - cron-выражение или псевдоним (@hourly, @daily, ...)
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Некорректное расписание: {value}")
+    if isinstance(value, (int, float)):
+        return IntervalSchedule(float(value))
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"Некорректное расписание: {value}")
+    match = INTERVAL_PATTERN.match(value.strip().lower())
+    if match:
+        return IntervalSchedule(float(match.group(1)) * INTERVAL_UNITS[match.group(2) or 's'])
+    return CronSchedule(value)
+
+
+class ScheduledJob:
+    """Скрипт с расписанием и временем следующего запуска"""
+
+    def __init__(self, key: str, query_data: Dict[str, Any], schedule, now: datetime):
+        self.key = key
+        self.query_data = query_data
+        self.name = query_data.get('name', key)
+        self.schedule = schedule
+        self.next_run = schedule.first_run(now)
+
+
+class ScheduleDaemon:
+    """
+    Постоянно работающий планировщик скриптов с ключом schedule.
+
+    Один процесс держит инициализированный пул соединений PostgresExecutorAsync
+    между запусками: соединения и кэш подготовленных выражений asyncpg
+    переиспользуются, запуск задания не требует старта интерпретатора,
+    чтения настроек и scripts.yml и создания пула.
+
+    При изменении scripts.yml (inotify или проверка mtime) файл перечитывается
+    и применяется только разница: добавленные, удаленные и измененные задания.
+
+    Скрипт не запускается повторно, пока не завершился его предыдущий запуск.
+    Количество одновременно выполняемых заданий ограничено ASYNC_CONCURRENT_MAX.
+    Остановка по SIGTERM/SIGINT: новые запуски прекращаются, выполняющиеся дожидаются завершения.
+    """
+
+    def __init__(
+        self,
+        executor: PostgresExecutorAsync,
+        scripts_data: Dict[str, Dict[str, Any]],
+        max_concurrent: Optional[int] = None,
+        history: Optional[ExecutionHistory] = None,
+        catalog: Optional[ParseScripts] = None,
+        reload_interval: float = 0
+    ):
+        """
+        Args:
+            executor: Инициализированный исполнитель
+            scripts_data: Словарь скриптов
+            max_concurrent: Максимальное количество одновременно выполняемых заданий
+            history: История длительности выполнения
+            catalog: Источник скриптов для горячей перезагрузки при изменении файла
+            reload_interval: Период проверки изменения файла без inotify (секунды, 0 - без перезагрузки)
+        """
+        self.executor = executor
+        self.history = history
+        self.catalog = catalog
+        self.reload_interval = reload_interval
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(max_concurrent or executor.concurrent_max)
+        self._stop = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self.load(scripts_data)
+
+    def _create_job(self, key: str, query_data: Dict[str, Any], now: datetime) -> Optional[ScheduledJob]:
+        query_data = query_data or {}
+        name = query_data.get('name', key)
+        if query_data.get('schedule') is None:
+            logger.warning(f"[{name}] Нет ключа schedule, в режиме daemon не запускается")
+            return None
+        if query_data.get('depends_on'):
+            logger.warning(f"[{name}] depends_on в режиме daemon не учитывается")
+        try:
+            job = ScheduledJob(key, query_data, parse_schedule(query_data['schedule']), now)
+        except ValueError as e:
+            logger.error(f"[{name}] Ошибка расписания: {e}")
+            return None
+        logger.info(f"[{job.name}] Расписание: {job.schedule}, первый запуск {job.next_run:%Y-%m-%d %H:%M:%S}")
+        return job
+
+    def load(self, scripts_data: Dict[str, Dict[str, Any]]) -> None:
+        """Построение списка заданий по скриптам с ключом schedule"""
+        now = datetime.now()
+        jobs = {}
+        for key, query_data in scripts_data.items():
+            job = self._create_job(key, query_data, now)
+            if job:
+                jobs[key] = job
+        self.jobs = jobs
+
+    def apply(self, diff: ScriptsDiff) -> None:
+        """
+        Применение изменений scripts.yml: пересоздаются только добавленные, удаленные
+        и измененные задания. Пул соединений и подготовленные выражения неизмененных
+        скриптов сохраняются. Выполняющиеся запуски завершаются со старыми параметрами.
+        """
+        now = datetime.now()
+        for key in diff.removed:
+            job = self.jobs.pop(key, None)
+            if job:
+                logger.info(f"[{job.name}] Удален из расписания")
+        for key, query_data in {**diff.added, **diff.changed}.items():
+            previous = self.jobs.pop(key, None)
+            job = self._create_job(key, query_data, now)
+            if job is None:
+                continue
+            # При неизменном расписании время следующего запуска сохраняется
+            if previous and previous.query_data.get('schedule') == job.query_data.get('schedule'):
+                job.next_run = previous.next_run
+            self.jobs[key] = job
+
+    def reload(self) -> None:
+        """Перезагрузка scripts.yml; при ошибке продолжают работать текущие задания"""
+        try:
+            diff = self.catalog.reload()
+        except Exception as e:
+            logger.error(f"Ошибка перезагрузки {self.catalog.file_path}, используются прежние скрипты: {e}")
+            return
+        if diff:
+            logger.info(f"Скрипты перезагружены: {diff}")
+            self.apply(diff)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    async def serve(self) -> None:
+        """Основной цикл: ожидание ближайшего запуска или изменения файла скриптов"""
+        watcher = None
+        if self.catalog is not None and self.reload_interval:
+            watcher = self.catalog.watch()
+        if not self.jobs:
+            if watcher is None:
+                logger.warning("Нет скриптов с расписанием")
+                return
+            logger.warning("Нет скриптов с расписанием, ожидание изменения файла скриптов")
+
+        loop = asyncio.get_running_loop()
+        if watcher and watcher.inotify:
+            loop.add_reader(watcher.fileno(), self._wakeup.set)
+        try:
+            while not self._stop.is_set():
+                self._wakeup.clear()
+                if watcher and watcher.changed():
+                    self.reload()
+
+                now = datetime.now()
+                for job in list(self.jobs.values()):
+                    if job.next_run <= now:
+                        self._fire(job, now)
+
+                delay = None
+                if self.jobs:
+                    delay = (min(job.next_run for job in self.jobs.values()) - datetime.now()).total_seconds()
+                if watcher and not watcher.inotify:
+                    delay = self.reload_interval if delay is None else min(delay, self.reload_interval)
+                if delay is None or delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if watcher:
+                if watcher.inotify:
+                    loop.remove_reader(watcher.fileno())
+                watcher.close()
+
+        running = list(self._running.values())
+        if running:
+            logger.info(f"Остановка: ожидание завершения {len(running)} заданий")
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def _fire(self, job: ScheduledJob, now: datetime) -> None:
+        scheduled = job.next_run
+        job.next_run = job.schedule.next_run(scheduled, now)
+        if job.key in self._running:
+            logger.warning(f"[{job.name}] Предыдущий запуск еще выполняется, запуск {scheduled:%H:%M:%S} пропущен")
+            return
+        self._running[job.key] = asyncio.create_task(self._run_job(job))
+
+    async def _run_job(self, job: ScheduledJob) -> Optional[QueryResult]:
+        default = default_policy()
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                async with self._slots:
+                    result = await self.executor.execute_script(job.key, job.query_data)
+                result.attempts = attempt
+                delay = self.executor.retry_delay(job.query_data, result, default)
+                if delay is None:
+                    break
+                # Задержка перед повтором - вне семафора; при остановке повтор не выполняется
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            logger.error(f"[{job.name}] Ошибка выполнения по расписанию: {e}")
+            return None
+        finally:
+            self._running.pop(job.key, None)
+
+        status = "УСПЕХ" if result.success else "ОШИБКА"
+        logger.info(
+            f"[{job.name}] {status} за {result.execution_time:.2f} сек, строк {result.rows_affected}; "
+            f"следующий запуск {job.next_run:%Y-%m-%d %H:%M:%S}"
+        )
+        if not result.success:
+            logger.error(f"[{job.name}] Ошибка: {result.error}")
+        if self.history and result.success:
+            self.history.record(result.query_name, result.execution_time)
+            self.history.save()
+        metrics.write_textfile(settings.METRICS_TEXTFILE)
+        return result
+
+    @staticmethod
+    async def run_async(
+        scripts_data: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_concurrent: Optional[int] = None
+    ) -> None:
+        """
+        Запуск планировщика до получения SIGTERM/SIGINT.
+        Без scripts_data скрипты берутся из scripts.yml и перезагружаются при его изменении
+        (SCRIPTS_RELOAD_INTERVAL, 0 - без перезагрузки).
+        """
+        logger.info("=" * 50)
+        logger.info("Запуск SQL-скриптов по расписанию (daemon)")
+        logger.info("=" * 50)
+
+        metrics.start_http_server(settings.METRICS_PORT)
+
+        executor = PostgresExecutorAsync(**settings.DATABASE_PARAMS)
+        await executor.initialize()
+        try:
+            daemon = ScheduleDaemon(
+                executor,
+                scripts_data or scripts.scripts,
+                max_concurrent=max_concurrent,
+                history=ExecutionHistory(),
+                catalog=None if scripts_data else scripts,
+                reload_interval=settings.SCRIPTS_RELOAD_INTERVAL
+            )
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.add_signal_handler(sig, daemon.stop)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            await daemon.serve()
+        finally:
+            await executor.close()
+            logger.info("Планировщик остановлен")
+
+    @staticmethod
+    def run() -> None:
+        asyncio.run(ScheduleDaemon.run_async())
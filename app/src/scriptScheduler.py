@@ -0,0 +1,158 @@
+import heapq
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+class ScriptGraph:
+    """
+    Граф зависимостей скриптов из scripts.yml (ключ depends_on).
+
+    Скрипт становится готовым к запуску, когда все его зависимости выполнены успешно.
+    При ошибке скрипта все зависящие от него (прямо или транзитивно) скрипты пропускаются.
+
+    Если известна ожидаемая длительность скриптов (durations), из готовых первым
+    запускается скрипт с самым длинным критическим путем (длительность скрипта плюс
+    самая длинная цепочка зависящих от него). Без зависимостей это правило LPT -
+    самые долгие скрипты первыми. При равных оценках сохраняется порядок из файла.
+
+    Использование:
+        graph = ScriptGraph(scripts)
+        key = graph.pop_ready()
+        ...
+        skipped = graph.complete(key, success)  # или graph.requeue(key) для повтора
+    """
+
+    def __init__(self, scripts: Dict[str, Dict[str, Any]], durations: Optional[Dict[str, float]] = None):
+        self.keys: List[str] = list(scripts.keys())
+        self.dependencies: Dict[str, Set[str]] = {}
+        self.dependents: Dict[str, List[str]] = {key: [] for key in self.keys}
+
+        # На зависимость можно сослаться как по ключу скрипта, так и по его name
+        aliases = {key: key for key in self.keys}
+        for key, item in scripts.items():
+            name = (item or {}).get('name')
+            if name and name not in aliases:
+                aliases[name] = key
+
+        for key, item in scripts.items():
+            depends_on = (item or {}).get('depends_on') or []
+            if isinstance(depends_on, str):
+                depends_on = [depends_on]
+            deps = set()
+            for dep in depends_on:
+                if dep not in aliases:
+                    raise ValueError(f"Скрипт '{key}' зависит от неизвестного скрипта '{dep}'")
+                if aliases[dep] == key:
+                    raise ValueError(f"Скрипт '{key}' зависит сам от себя")
+                deps.add(aliases[dep])
+            self.dependencies[key] = deps
+            for dep in deps:
+                self.dependents[dep].append(key)
+
+        self.order: List[str] = self._topological_order()
+        self.priority: Dict[str, float] = self._critical_paths(durations or {})
+        self._index = {key: i for i, key in enumerate(self.keys)}
+
+        self._waiting: Dict[str, int] = {key: len(deps) for key, deps in self.dependencies.items()}
+        self._ready: List[Tuple[float, int, str]] = []
+        for key in self.keys:
+            if not self.dependencies[key]:
+                self._push_ready(key)
+        self._finished: Set[str] = set()
+        self._running = 0
+
+    def _topological_order(self) -> List[str]:
+        """Топологическая сортировка (алгоритм Кана) с проверкой на циклы"""
+        waiting = {key: len(deps) for key, deps in self.dependencies.items()}
+        queue = deque(key for key in self.keys if not waiting[key])
+        order = []
+        while queue:
+            key = queue.popleft()
+            order.append(key)
+            for dependent in self.dependents[key]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    queue.append(dependent)
+        if len(order) != len(self.keys):
+            cycle = [key for key in self.keys if waiting[key]]
+            raise ValueError(f"Циклические зависимости между скриптами: {', '.join(cycle)}")
+        return order
+
+    def _critical_paths(self, durations: Dict[str, float]) -> Dict[str, float]:
+        """Длина критического пути от каждого скрипта до конца графа"""
+        paths: Dict[str, float] = {}
+        for key in reversed(self.order):
+            tail = max((paths[dependent] for dependent in self.dependents[key]), default=0.0)
+            paths[key] = durations.get(key, 0.0) + tail
+        return paths
+
+    def _push_ready(self, key: str) -> None:
+        heapq.heappush(self._ready, (-self.priority[key], self._index[key], key))
+
+    def components(self) -> List[List[str]]:
+        """Группы связанных зависимостями скриптов (каждую можно выполнять независимо)"""
+        seen: Set[str] = set()
+        groups = []
+        for key in self.keys:
+            if key in seen:
+                continue
+            group = []
+            stack = [key]
+            seen.add(key)
+            while stack:
+                current = stack.pop()
+                group.append(current)
+                for neighbour in list(self.dependencies[current]) + self.dependents[current]:
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        stack.append(neighbour)
+            groups.append(sorted(group, key=self.keys.index))
+        return groups
+
+    def has_ready(self) -> bool:
+        """Есть ли скрипты, готовые к запуску"""
+        return bool(self._ready)
+
+    def pop_ready(self) -> Optional[str]:
+        """Следующий готовый к запуску скрипт (или None)"""
+        if not self._ready:
+            return None
+        self._running += 1
+        return heapq.heappop(self._ready)[2]
+
+    def requeue(self, key: str) -> None:
+        """Возврат выполнявшегося скрипта в очередь готовых (повтор после временной ошибки)"""
+        self._running -= 1
+        self._push_ready(key)
+
+    def finished(self) -> bool:
+        """Все скрипты выполнены или пропущены"""
+        return not self._ready and not self._running
+
+    def complete(self, key: str, success: bool) -> List[Tuple[str, str]]:
+        """
+        Отметка о завершении скрипта
+
+        Returns:
+            Список пропущенных скриптов: (ключ пропущенного скрипта, ключ скрипта с ошибкой)
+        """
+        self._running -= 1
+        self._finished.add(key)
+
+        if success:
+            for dependent in self.dependents[key]:
+                self._waiting[dependent] -= 1
+                if not self._waiting[dependent] and dependent not in self._finished:
+                    self._push_ready(dependent)
+            return []
+
+        skipped = []
+        queue = deque(self.dependents[key])
+        while queue:
+            dependent = queue.popleft()
+            if dependent in self._finished:
+                continue
+            self._finished.add(dependent)
+            skipped.append((dependent, key))
+            queue.extend(self.dependents[dependent])
+        return skipped
@@ -0,0 +1,147 @@
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.logger import logger
+
+
+class Span:
+    """Интервал выполнения с атрибутами"""
+    __slots__ = ('name', 'start', 'end', 'track', 'attributes')
+
+    def __init__(self, name: str, start: float, track: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.start = start
+        self.end = start
+        self.track = track
+        self.attributes = attributes
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class Tracer:
+    """
+    Сбор интервалов выполнения (span) запуска и запись в формате Chrome trace-event JSON.
+    Файл открывается в Perfetto (ui.perfetto.dev) или chrome://tracing без сборщика.
+
+    Вложенность интервалов определяется текущим интервалом контекста (contextvars),
+    поэтому работает и для задач asyncio, и для потоков. Каждый скрипт выводится
+    на отдельной дорожке (track), вложенные интервалы - на дорожке родителя.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.file_path = ''
+        self._lock = threading.Lock()
+        self._spans: List[Span] = []
+        self._events: List[Dict[str, Any]] = []
+        self._tracks = itertools.count(1)
+        self._track_names: Dict[int, str] = {}
+
+    def start(self, file_path: str = '', enabled: Optional[bool] = None) -> None:
+        """Начало сбора интервалов; без file_path сбор выключен (если не задан enabled)"""
+        with self._lock:
+            self.file_path = file_path
+            self.enabled = bool(file_path) if enabled is None else enabled
+            self._spans = []
+            self._events = []
+            self._tracks = itertools.count(1)
+            self._track_names = {}
+
+    def current(self) -> Optional[Span]:
+        return _current.get()
+
+    def _track(self, name: str, parent: Optional[Span], new_track: bool) -> int:
+        if parent is not None and not new_track:
+            return parent.track
+        with self._lock:
+            track = next(self._tracks)
+            self._track_names[track] = name
+        return track
+
+    @contextmanager
+    def span(self, name: str, new_track: bool = False, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Интервал вокруг блока кода; new_track - вывести на отдельной дорожке"""
+        if not self.enabled:
+            yield None
+            return
+        parent = _current.get()
+        span = Span(name, time.time(), self._track(name, parent, new_track), attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes['error'] = str(e)
+            raise
+        finally:
+            span.end = time.time()
+            _current.reset(token)
+            with self._lock:
+                self._spans.append(span)
+
+    def record(self, name: str, seconds: float, **attributes: Any) -> None:
+        """Завершившийся только что интервал длительностью seconds внутри текущего"""
+        if not self.enabled:
+            return
+        parent = _current.get()
+        end = time.time()
+        span = Span(name, end - seconds, self._track(name, parent, False), attributes)
+        span.end = end
+        with self._lock:
+            self._spans.append(span)
+
+    def events(self) -> List[Dict[str, Any]]:
+        """События trace-event для собранных интервалов (включая добавленные через extend)"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self._spans)
+            track_names = dict(self._track_names)
+            events = list(self._events)
+        for track, name in track_names.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': track, 'args': {'name': name}})
+        for span in spans:
+            events.append({
+                'name': span.name,
+                'cat': 'sql',
+                'ph': 'X',
+                'ts': round(span.start * 1_000_000),
+                'dur': max(round((span.end - span.start) * 1_000_000), 0),
+                'pid': pid,
+                'tid': span.track,
+                'args': span.attributes
+            })
+        return events
+
+    def extend(self, events: List[Dict[str, Any]]) -> None:
+        """Добавление событий, собранных в другом процессе"""
+        with self._lock:
+            self._events.extend(events)
+
+    def write(self, file_path: Optional[str] = None) -> None:
+        """Атомарная запись trace-файла"""
+        file_path = file_path or self.file_path
+        if not self.enabled or not file_path:
+            return
+        try:
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, file_path)
+            logger.info(f"Трассировка запуска записана в {file_path}")
+        except OSError as e:
+            logger.error(f"Не удалось записать трассировку в {file_path}: {e}")
+
+
+TRACER = Tracer()
@@ -0,0 +1,168 @@
+import mmap
+import os
+import pickle
+import tempfile
+from array import array
+from collections.abc import Sequence as SequenceABC
+from typing import Any, List, Optional, Sequence
+
+from src.rowFormats import convert_rows
+
+# Количество строк в одном блоке файла: блок - единица записи и ленивого чтения
+SPILL_BLOCK_ROWS = 1000
+# Количество строк для оценки размера порции
+SPILL_SAMPLE_ROWS = 100
+
+
+class SpilledRows(SequenceABC):
+    """
+    Строки результата, сброшенные на диск.
+
+    Файл состоит из блоков по SPILL_BLOCK_ROWS строк (pickle списка кортежей),
+    в памяти хранятся только смещения блоков. Доступ к строкам идет через mmap,
+    блок декодируется при первом обращении к его строкам (последний блок кэшируется).
+    Строки возвращаются словарями (row_format dict) или кортежами.
+    Файл удаляется при close() или сборке объекта.
+    """
+
+    def __init__(self, path: str, offsets: array, length: int, columns: Sequence[str], as_dict: bool):
+        self.path = path
+        self.offsets = offsets
+        self.length = length
+        self.columns = tuple(columns)
+        self.as_dict = as_dict
+        self.owner = True
+        self._open()
+
+    def _open(self) -> None:
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.length else None
+        self._block_index = -1
+        self._block: List[tuple] = []
+
+    def _load_block(self, index: int) -> List[tuple]:
+        if index != self._block_index:
+            self._block = pickle.loads(self._map[self.offsets[index]:self.offsets[index + 1]])
+            self._block_index = index
+        return self._block
+
+    def _row(self, values: tuple) -> Any:
+        return dict(zip(self.columns, values)) if self.as_dict else values
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("Индекс строки вне диапазона")
+        block, position = divmod(index, SPILL_BLOCK_ROWS)
+        return self._row(self._load_block(block)[position])
+
+    def __iter__(self):
+        for block in range(len(self.offsets) - 1):
+            for values in self._load_block(block):
+                yield self._row(values)
+
+    def close(self) -> None:
+        """Закрытие отображения и удаление файла (если объект им владеет)"""
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+            if self.owner and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __del__(self):
+        self.close()
+
+    def __getstate__(self):
+        # Для передачи между процессами передается путь к файлу, а не строки
+        return {key: getattr(self, key) for key in ('path', 'offsets', 'length', 'columns', 'as_dict')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.owner = True
+        self._open()
+
+
+class SpillBuffer:
+    """
+    Накопитель строк результата со сбросом на диск.
+
+    Пока оценка размера накопленных строк меньше threshold_bytes, строки хранятся
+    в памяти. После превышения порога все строки пишутся во временный файл блоками,
+    и в памяти остается не больше одного блока.
+    """
+
+    def __init__(self, threshold_bytes: int, row_format: str = 'dict', directory: Optional[str] = None):
+        self.threshold_bytes = threshold_bytes
+        self.row_format = row_format
+        self.directory = directory or None
+        self.columns: Optional[List[str]] = None
+        self.length = 0
+        self.estimated_bytes = 0
+        self._rows: List[Any] = []
+        self._file = None
+        self._path: Optional[str] = None
+        self._offsets = array('Q', [0])
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def extend(self, rows: Sequence[Any], columns: Optional[Sequence[str]] = None) -> None:
+        """Добавление порции строк (asyncpg.Record или кортежи с columns)"""
+        if not rows:
+            return
+        if self.columns is None:
+            self.columns = list(columns) if columns is not None else list(rows[0].keys())
+        self.length += len(rows)
+        if self.spilled:
+            self._rows.extend(tuple(row) for row in rows)
+            self._flush(final=False)
+            return
+        self._rows.extend(rows)
+        sample = [tuple(row) for row in rows[:SPILL_SAMPLE_ROWS]]
+        self.estimated_bytes += len(pickle.dumps(sample, pickle.HIGHEST_PROTOCOL)) * len(rows) // len(sample)
+        if self.threshold_bytes and self.estimated_bytes > self.threshold_bytes:
+            self._spill()
+
+    def _spill(self) -> None:
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        fd, self._path = tempfile.mkstemp(prefix='sqlexecute_spill_', suffix='.bin', dir=self.directory)
+        self._file = os.fdopen(fd, 'wb')
+        self._rows = [tuple(row) for row in self._rows]
+        self._flush(final=False)
+
+    def _flush(self, final: bool) -> None:
+        rows = self._rows
+        # Без final неполный последний блок остается в памяти до следующей порции
+        end = len(rows) if final else len(rows) - len(rows) % SPILL_BLOCK_ROWS
+        for start in range(0, end, SPILL_BLOCK_ROWS):
+            block = rows[start:min(start + SPILL_BLOCK_ROWS, end)]
+            self._file.write(pickle.dumps(block, pickle.HIGHEST_PROTOCOL))
+            self._offsets.append(self._file.tell())
+        self._rows = rows[end:]
+
+    def result(self) -> Any:
+        """Итоговые данные: строки в памяти в формате row_format или SpilledRows"""
+        if not self.spilled:
+            return convert_rows(self._rows, self.row_format, self.columns)
+        self._flush(final=True)
+        self._file.close()
+        return SpilledRows(self._path, self._offsets, self.length, self.columns or [], self.row_format == 'dict')
+
+    def discard(self) -> None:
+        """Удаление временного файла при ошибке"""
+        if self.spilled:
+            self._file.close()
+            if os.path.exists(self._path):
+                os.remove(self._path)
+        self._rows = []
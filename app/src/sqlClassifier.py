@@ -0,0 +1,282 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# Лексемы SQL: комментарии, строки, идентификаторы в кавычках и dollar-quoting пропускаются,
+# ключевые слова учитываются с глубиной вложенности скобок
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<line_comment>--[^\n]*)
+  | (?P<block_comment>/\*)
+  | (?P<estring>[Ee]'(?:[^'\\]|\\.|'')*'?)
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<ident>"(?:[^"]|"")*"?)
+  | (?P<param>\$\d+)
+  | (?P<dollar>\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$)
+  | (?P<pyformat>%%|%s(?![A-Za-z0-9_])|%\([^()%]*\)s)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<semicolon>;)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Основная команда после списка CTE в WITH
+WITH_COMMANDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'VALUES', 'TABLE'}
+# Команды, возвращающие строки
+ROW_COMMANDS = {'SELECT', 'VALUES', 'TABLE', 'SHOW', 'EXPLAIN', 'FETCH'}
+# Команды изменения данных: возвращают строки только с RETURNING
+DML_COMMANDS = {'INSERT', 'UPDATE', 'DELETE', 'MERGE'}
+# Ключевые слова изменения данных в любом месте запроса (включая CTE)
+MODIFYING_WORDS = DML_COMMANDS | {'TRUNCATE'}
+# Команды, которые нельзя выполнять внутри явной транзакции
+NON_TRANSACTIONAL_COMMANDS = {'VACUUM', 'CALL', 'BEGIN', 'START', 'COMMIT', 'END', 'ROLLBACK', 'ABORT'}
+# Команды, допустимые в DECLARE ... CURSOR FOR
+CURSOR_COMMANDS = {'SELECT', 'VALUES', 'TABLE'}
+# Режимы раздельного выполнения выражений скрипта (ключ split)
+SPLIT_MODES = (True, 'pipeline')
+
+
+@dataclass(frozen=True)
+class StatementInfo:
+    """Классификация одного SQL-выражения"""
+    command: str  # Основная команда: SELECT, INSERT, ... (для WITH - команда после CTE)
+    returns_rows: bool  # Возвращает строки (SELECT, VALUES, TABLE, SHOW, EXPLAIN, DML с RETURNING)
+    read_only: bool  # Только чтение: без изменения данных, блокировок строк и SELECT INTO
+    transactional: bool  # Может выполняться внутри явной транзакции (не VACUUM, CALL, ... CONCURRENTLY)
+    declarable: bool  # Можно объявить серверным курсором DECLARE ... CURSOR FOR
+
+
+# Выражение без ключевых слов: считается возвращающим строки, как и любой неизвестный запрос
+UNKNOWN_STATEMENT = StatementInfo(command='', returns_rows=True, read_only=False, transactional=True,
+                                  declarable=False)
+
+
+@dataclass(frozen=True)
+class SqlInfo:
+    """Классификация текста скрипта (одно или несколько выражений через ;)"""
+    statements: Tuple[StatementInfo, ...]
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def command(self) -> str:
+        return self.statements[-1].command if self.statements else ''
+
+    @property
+    def returns_rows(self) -> bool:
+        """Строки возвращает единственное выражение скрипта"""
+        return self.count == 1 and self.statements[0].returns_rows
+
+    @property
+    def declarable(self) -> bool:
+        """Результат можно читать именованным курсором psycopg2 (DECLARE ... CURSOR FOR)"""
+        return self.count == 1 and self.statements[0].declarable
+
+    @property
+    def read_only(self) -> bool:
+        return bool(self.statements) and all(statement.read_only for statement in self.statements)
+
+    @property
+    def transactional(self) -> bool:
+        return all(statement.transactional for statement in self.statements)
+
+
+def _skip_block_comment(sql: str, pos: int) -> int:
+    """Конец вложенного комментария /* ... */, начинающегося в pos"""
+    depth = 0
+    while pos < len(sql):
+        if sql.startswith('/*', pos):
+            depth += 1
+            pos += 2
+        elif sql.startswith('*/', pos):
+            depth -= 1
+            pos += 2
+            if depth == 0:
+                return pos
+        else:
+            pos += 1
+    return pos
+
+
+def _scan(sql: str) -> Iterator[Tuple[str, int, int, int]]:
+    """Лексемы скрипта: (вид, начало, конец, глубина скобок); комментарии и $$-строки целиком"""
+    depth = 0
+    pos = 0
+    while pos < len(sql):
+        match = _TOKEN.match(sql, pos)
+        kind = match.lastgroup
+        pos = match.end()
+        if kind == 'block_comment':
+            pos = _skip_block_comment(sql, match.start())
+        elif kind == 'dollar':
+            end = sql.find(match.group(), pos)
+            pos = len(sql) if end < 0 else end + len(match.group())
+        elif kind == 'open':
+            depth += 1
+        elif kind == 'close':
+            depth = max(depth - 1, 0)
+        yield kind, match.start(), pos, depth
+
+
+def split_words(sql: str) -> List[List[Tuple[str, int]]]:
+    """Ключевые слова (в верхнем регистре) с глубиной скобок по каждому выражению скрипта"""
+    statements: List[List[Tuple[str, int]]] = []
+    words: List[Tuple[str, int]] = []
+    for kind, start, end, depth in _scan(sql):
+        if kind == 'word':
+            words.append((sql[start:end].upper(), depth))
+        elif kind == 'semicolon' and depth == 0:
+            if words:
+                statements.append(words)
+            words = []
+    if words:
+        statements.append(words)
+    return statements
+
+
+def classify_statement(words: List[Tuple[str, int]]) -> StatementInfo:
+    """Классификация выражения по его ключевым словам"""
+    if not words:
+        return UNKNOWN_STATEMENT
+    # Запрос может начинаться со скобки: (SELECT ...) UNION (SELECT ...) - основная
+    # команда и ее ключевые слова берутся на глубине первого слова
+    first, first_depth = words[0]
+    top = [word for word, depth in words if depth == first_depth]
+    command = first
+    if first == 'WITH':
+        command = next((word for word in top[1:] if word in WITH_COMMANDS), 'SELECT')
+
+    modifies = False
+    locking = False
+    previous = ''
+    for word, _ in words:
+        if word in ('UPDATE', 'SHARE') and previous in ('FOR', 'KEY'):
+            # FOR UPDATE / FOR NO KEY UPDATE / FOR SHARE / FOR KEY SHARE
+            locking = True
+        elif word in MODIFYING_WORDS:
+            modifies = True
+        previous = word
+
+    select_into = command == 'SELECT' and 'INTO' in top
+    if command in ROW_COMMANDS:
+        returns_rows = not select_into
+    else:
+        returns_rows = command in DML_COMMANDS and 'RETURNING' in top
+
+    transactional = not (
+        first in NON_TRANSACTIONAL_COMMANDS
+        or (first in ('CREATE', 'DROP', 'REINDEX') and 'CONCURRENTLY' in top)
+        or (first in ('CREATE', 'DROP') and len(top) > 1 and top[1] in ('DATABASE', 'TABLESPACE'))
+        or (first == 'ALTER' and top[1:2] == ['SYSTEM'])
+    )
+
+    return StatementInfo(
+        command=command,
+        returns_rows=returns_rows,
+        read_only=command in ROW_COMMANDS and command != 'FETCH' and not (modifies or locking or select_into),
+        transactional=transactional,
+        declarable=command in CURSOR_COMMANDS and returns_rows and not modifies
+    )
+
+
+@dataclass(frozen=True)
+class Statement:
+    """Выражение скрипта для раздельного выполнения (ключ split)"""
+    text: str  # Текст выражения; параметры $n перенумерованы с $1
+    info: StatementInfo
+    params: Tuple[int, ...] = ()  # Индексы параметров скрипта для параметров выражения по порядку
+
+    def bind(self, params: Optional[Union[List[Any], Dict[str, Any]]]) -> Optional[Union[List[Any], Dict[str, Any]]]:
+        """Параметры выражения из параметров скрипта (именованные передаются целиком)"""
+        if params is None or isinstance(params, dict):
+            return params
+        return [params[index] for index in self.params]
+
+
+def split_statements(sql: str, paramstyle: str = 'numeric') -> List[Statement]:
+    """
+    Разбиение скрипта на выражения по ; вне строк, комментариев, $$-строк и скобок.
+
+    paramstyle 'numeric' (asyncpg): параметры $n каждого выражения перенумеровываются
+    с $1 в порядке появления, params - индексы исходных параметров скрипта.
+    paramstyle 'pyformat' (psycopg2): позиционные %s распределяются по выражениям по порядку,
+    именованные %(name)s получают словарь параметров скрипта целиком.
+    """
+    statements: List[Statement] = []
+    pieces: List[str] = []
+    words: List[Tuple[str, int]] = []
+    numbers: Dict[int, int] = {}
+    params: List[int] = []
+    position = 0
+
+    def finish() -> None:
+        text = ''.join(pieces).strip()
+        if words:
+            statements.append(Statement(text, classify_statement(words), tuple(params)))
+        pieces.clear()
+        words.clear()
+        numbers.clear()
+        params.clear()
+
+    for kind, start, end, depth in _scan(sql):
+        token = sql[start:end]
+        if kind == 'semicolon' and depth == 0:
+            finish()
+            continue
+        if kind == 'word':
+            words.append((token.upper(), depth))
+        elif kind == 'param' and paramstyle == 'numeric':
+            number = int(token[1:])
+            if number not in numbers:
+                numbers[number] = len(numbers) + 1
+                params.append(number - 1)
+            token = f"${numbers[number]}"
+        elif kind == 'pyformat' and paramstyle == 'pyformat' and token == '%s':
+            params.append(position)
+            position += 1
+        pieces.append(token)
+    finish()
+    return statements
+
+
+def group_statements(statements: List[Statement], batchable: Callable[[Statement], bool]) -> List[List[Statement]]:
+    """Объединение подряд идущих выражений, для которых batchable истинно, в группы (режим pipeline)"""
+    groups: List[List[Statement]] = []
+    for statement in statements:
+        if groups and batchable(statement) and all(batchable(previous) for previous in groups[-1]):
+            groups[-1].append(statement)
+        else:
+            groups.append([statement])
+    return groups
+
+
+def split_mode(value: Any) -> Any:
+    """Проверка значения ключа split: true - по очереди, pipeline - с объединением обращений"""
+    if value not in SPLIT_MODES:
+        raise ValueError(f"Неподдерживаемое значение split: {value}. Допустимые: true, pipeline")
+    return value
+
+
+# Кэш классификации по тексту скрипта. Текст скрипта - один и тот же объект str
+# при каждом запуске, поэтому поиск в кэше не пересчитывает хэш и не сравнивает текст
+_CACHE: Dict[str, SqlInfo] = {}
+CACHE_SIZE = 4096
+
+
+def classify_sql(sql: str) -> SqlInfo:
+    """Классификация скрипта (с кэшированием)"""
+    info = _CACHE.get(sql)
+    if info is None:
+        info = SqlInfo(tuple(classify_statement(words) for words in split_words(sql)))
+        if len(_CACHE) >= CACHE_SIZE:
+            _CACHE.clear()
+        _CACHE[sql] = info
+    return info
+
+
+def prime(classes: Dict[str, SqlInfo]) -> None:
+    """Заполнение кэша готовой классификацией (из каталога скриптов)"""
+    _CACHE.update(classes)